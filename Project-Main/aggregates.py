@@ -0,0 +1,166 @@
+## Aggregates
+# Dense count cube of the execution data, built once at load.
+# Every aggregate view (map, line chart, bar/pie charts, counters) is a slice-and-sum over this
+# cube, so the callbacks no longer scan Data row by row.
+# Views that are not split by year read a year window from cumulative (prefix) sums over the year
+# axis instead: two lookups and a subtraction, however many years the window covers.
+
+import numpy as np
+import pandas as pd
+
+# Axis order of the cube
+CUBE_AXES = ("Execution Year", "State", "Sex", "Race", "Execution Method")
+YEAR, STATE, SEX, RACE, METHOD = range(len(CUBE_AXES))
+
+# Victim counts per row, summed into a cube of their own (see cfg.py). Its cells have an extra last axis with these
+# columns, which reshapes to (victim sex, victim race).
+VICTIM_SEXES = ("Male", "Female")
+VICTIM_RACES = ("White", "Black", "Latino", "Asian", "Native American", "Other Race")
+VICTIM_COLUMNS = [f"Number of {race} {sex} Victims" for sex in VICTIM_SEXES for race in VICTIM_RACES]
+
+
+# The build steps are separate functions, so the arrays can be stored and memory-mapped (see cfg.py).
+# Bump when what they build changes (count_rows, CUBE_AXES, VICTIM_COLUMNS), stored arrays are then rebuilt.
+CUBE_VERSION = 1
+
+def frame_axes(df):
+    # Contiguous years and the category labels of every other axis
+    years = np.arange(int(df["Execution Year"].min()), int(df["Execution Year"].max()) + 1)
+    labels = {col: pd.Index(df[col].cat.categories) for col in CUBE_AXES[1:]}
+    return years, labels
+
+
+def count_rows(df, years, labels, columns=None):
+    # Encode every row as an index into the cube. With columns, every cell sums those columns over its rows (one
+    # entry per column on an extra last axis) instead of counting the rows.
+    index = [df["Execution Year"].to_numpy() - years[0]]
+    index += [df[col].cat.codes.to_numpy() for col in CUBE_AXES[1:]]
+    # Rows with a missing label (code -1) have no cell, the index would wrap around to the last label
+    complete = np.logical_and.reduce([codes >= 0 for codes in index[1:]])
+    if not complete.all():
+        index = [axis[complete] for axis in index]
+        df = df[complete]
+
+    shape = (len(years),) + tuple(len(labels[col]) for col in CUBE_AXES[1:])
+    if columns is None:
+        counts = np.zeros(shape, dtype=np.int32)
+        np.add.at(counts, tuple(index), 1)
+    else:
+        counts = np.zeros(shape + (len(columns),), dtype=np.int32)
+        np.add.at(counts, tuple(index), df[columns].to_numpy(dtype=np.int32))
+    return counts
+
+
+def prefix_sums(counts):
+    return np.concatenate([np.zeros((1,) + counts.shape[1:], dtype=np.int64),
+                           counts.cumsum(axis=0, dtype=np.int64)])
+
+
+class CountCube:
+    def __init__(self, counts, years, labels, cumulative=None, columns=None):
+        # counts[year, state, sex, race, method] = number of executions
+        # (or counts[year, state, sex, race, method, column] = sum of the column, when built with columns)
+        self.counts = counts
+        self.columns = columns
+        # Contiguous year axis (years without executions are kept as zero rows)
+        self.years = years
+        # Category labels for every non-year axis, e.g. labels["State"][i] is the state at index i
+        self.labels = labels
+        # cumulative[i] = counts of all years before index i (cumulative[0] is all zeros)
+        self.cumulative = prefix_sums(counts) if cumulative is None else cumulative
+
+    @classmethod
+    def from_frame(cls, df, columns=None):
+        years, labels = frame_axes(df)
+        return cls(count_rows(df, years, labels, columns), years, labels, columns=columns)
+
+    def extended(self, df):
+        # New cube with the rows of df added (see ingest.py). The categories of df must start with the labels of this
+        # cube, new years and labels are appended to the axes. Only the cells of the new rows are counted, the
+        # existing counts are copied over.
+        years = np.arange(min(int(self.years[0]), int(df["Execution Year"].min())),
+                          max(int(self.years[-1]), int(df["Execution Year"].max())) + 1)
+        labels = {col: pd.Index(df[col].cat.categories) for col in CUBE_AXES[1:]}
+        for col in CUBE_AXES[1:]:
+            if not labels[col][:len(self.labels[col])].equals(self.labels[col]):
+                raise ValueError(f"Categories of {col} do not extend the cube labels")
+
+        counts = count_rows(df, years, labels, self.columns)
+        offset = self.years[0] - years[0]
+        counts[tuple(slice(start, start + n) for start, n in zip((offset, 0, 0, 0, 0), self.counts.shape))] += self.counts
+        return CountCube(counts, years, labels, columns=self.columns)
+
+    def year_index(self, first, last):
+        # Index array of the years first..last (inclusive), clipped to the cube
+        first = max(first, self.years[0])
+        last = min(last, self.years[-1])
+        return np.arange(first - self.years[0], last - self.years[0] + 1)
+
+    def label_index(self, axis, values):
+        # Index array of the labels of an axis that are in values (same semantics as Series.isin)
+        return np.flatnonzero(self.labels[axis].isin(values))
+
+    def axis_labels(self, axis):
+        if axis == YEAR:
+            return self.years
+        return self.labels[CUBE_AXES[axis]]
+
+    def window(self, years):
+        # Counts summed over a contiguous year index (as given by year_index), from the prefix sums
+        if len(years) == 0:
+            return np.zeros(self.counts.shape[1:], dtype=np.int64)
+        return self.cumulative[years[-1] + 1] - self.cumulative[years[0]]
+
+    def totals(self, index, by=()):
+        # Sum of the sub-cube at index (one index array per axis) over every axis not in by.
+        # The remaining axes keep CUBE_AXES order (followed by the column axis of a cube built with columns).
+        if YEAR in by:
+            sub = self.counts[np.ix_(*index)]
+        else:
+            sub = self.window(index[YEAR])[np.ix_(*index[1:])][np.newaxis]
+        return sub.sum(axis=tuple(axis for axis in range(len(CUBE_AXES)) if axis not in by))
+
+    def frame(self, index, by):
+        # Same as totals, as a DataFrame with one label column per axis in by and an "Executions"
+        # column. Cells without executions are left out.
+        by = sorted(by)
+        sums = self.totals(index, by)
+        cells = np.nonzero(sums)
+        df = pd.DataFrame({CUBE_AXES[axis]: np.asarray(self.axis_labels(axis)[index[axis]])[cell]
+                           for axis, cell in zip(by, cells)})
+        df["Executions"] = sums[cells]
+        return df
+
+
+class CountyIndex:
+    # Rows of the data grouped by state and county: order holds the row positions sorted by (state, county), the rows
+    # of a pair are a range of it. Only the rows of one state are touched to count its counties.
+    def __init__(self, order, starts, states, counties):
+        self.order = order
+        # order[starts[k]:starts[k + 1]] are the rows of pair k = state code * (len(counties) + 1) + county code + 1,
+        # slot 0 of a state holds its rows without a county
+        self.starts = starts
+        self.states = states
+        self.counties = counties
+
+    @classmethod
+    def from_frame(cls, df):
+        states = pd.Index(df["State"].cat.categories)
+        counties = pd.Index(df["County"].cat.categories)
+        keys = df["State"].cat.codes.to_numpy().astype(np.int64) * (len(counties) + 1) + \
+            df["County"].cat.codes.to_numpy() + 1
+        # Rows without a state are left out, rows without a county are kept as rows of their state
+        rows = np.flatnonzero(df["State"].cat.codes.to_numpy() >= 0)
+        order = rows[np.argsort(keys[rows], kind="stable")].astype(np.int32)
+        starts = np.searchsorted(keys[order], np.arange(len(states) * (len(counties) + 1) + 1))
+        return cls(order, starts, states, counties)
+
+    def rows(self, state, county=None):
+        # Row positions of a state (in county order, those without a county first), or of one of its counties
+        if state not in self.states or (county is not None and county not in self.counties):
+            return self.order[:0]
+        first = self.states.get_loc(state) * (len(self.counties) + 1)
+        if county is None:
+            return self.order[self.starts[first]:self.starts[first + len(self.counties) + 1]]
+        first += self.counties.get_loc(county) + 1
+        return self.order[self.starts[first]:self.starts[first + 1]]
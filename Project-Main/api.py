@@ -0,0 +1,140 @@
+## Aggregate API
+# Read-only JSON endpoints with the numbers of the dashboard, for other tools (routes in main.py):
+#   GET /api/v1/dimensions   years and the values of every dimension
+#   GET /api/v1/counts       executions under the dashboard filters, optionally split by dimensions
+# /api/v1/counts takes the filters as query parameters, lists comma separated:
+#   by=state,year           dimensions to split by (year, state, sex, race, method), the total when empty
+#   year=2005               last year of the period (default: last year of the data)
+#   accumulate=1            the period starts at the first year of the data (Accumulate Years)
+#   first_year=1990         the period is first_year..year (year range mode)
+#   gender=, race=, method= checklist values (default: the dashboard's defaults), state= one state (default: all)
+# e.g. /api/v1/counts?by=state&year=2005&accumulate=1&method=Electrocution
+# Counts come from the count cube with the same selection as the plot functions (see Selection), so they match the
+# charts.
+#
+# Responses carry a strong ETag made of the data version (cfg.data_version) and the query, a repeated request is
+# answered with 304 before anything is computed. Cache-Control lets clients and proxies reuse a response for
+# MAX_AGE seconds, rows added while running (see ingest.py) change the version and the ETags.
+
+import hashlib
+
+import flask
+import pandas as pd
+
+import cfg
+import plot_functions
+from aggregates import YEAR, STATE, SEX, RACE, METHOD, CUBE_AXES
+from figstore import DEFAULT_CHECKLISTS
+from query import Query
+
+# API name -> cube axis
+DIMENSIONS = {"year": YEAR, "state": STATE, "sex": SEX, "race": RACE, "method": METHOD}
+# Checklist axis -> values ticked when the dashboard opens, the default of the API as well
+DEFAULT_VALUES = dict(zip((SEX, RACE, METHOD), DEFAULT_CHECKLISTS))
+# Seconds a response may be reused without asking again
+MAX_AGE = 60
+
+
+def int_arg(args, name, default=None):
+    value = args.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+
+
+def list_arg(args, name, axis):
+    # Comma separated values (the parameter may also be repeated), the dashboard's default selection when missing
+    if name not in args:
+        return tuple(sorted(DEFAULT_VALUES[axis]))
+    return tuple(sorted({value for arg in args.getlist(name) for value in arg.split(",") if value}))
+
+
+def parse_counts(args):
+    # Query and split dimensions of a /api/v1/counts request (args: request.args), raises ValueError
+    by = [name for name in args.get("by", "").split(",") if name]
+    unknown = [name for name in by if name not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown dimensions: {', '.join(unknown)} (use {', '.join(DIMENSIONS)})")
+    year = int_arg(args, "year", int(plot_functions.cube.years[-1]))
+    first_year = int_arg(args, "first_year")
+    if first_year is not None and first_year > year:
+        raise ValueError("first_year is after year")
+    query = Query(
+        year=year,
+        accumulate=first_year is None and args.get("accumulate", "0").lower() in ("1", "true", "yes"),
+        gender=list_arg(args, "gender", SEX),
+        race=list_arg(args, "race", RACE),
+        methods=list_arg(args, "method", METHOD),
+        state=args.get("state") or None,
+        first_year=first_year,
+    )
+    return query, tuple(dict.fromkeys(by))
+
+
+def counts(query, by):
+    cube = plot_functions.cube
+    index = plot_functions.selection(query).index(query.state)
+    names = sorted(by, key=DIMENSIONS.get)
+    if names:
+        df = cube.frame(index, [DIMENSIONS[name] for name in names])
+        df.columns = names + ["executions"]
+    else:
+        # Not split: the total as one row (frame leaves cells without executions out)
+        df = pd.DataFrame({"executions": [int(cube.totals(index))]})
+    first_year, last_year = plot_functions.year_range(query)
+    return {
+        "version": cfg.data_version,
+        "filters": {
+            "first_year": int(first_year),
+            "year": last_year,
+            "state": query.state,
+            "gender": list(query.gender),
+            "race": list(query.race),
+            "method": list(query.methods),
+        },
+        "by": names,
+        "total": int(df["executions"].sum()),
+        "counts": df.to_dict("records"),
+    }
+
+
+def dimensions():
+    cube = plot_functions.cube
+    return {
+        "version": cfg.data_version,
+        "year": [int(cube.years[0]), int(cube.years[-1])],
+        **{name: cube.labels[CUBE_AXES[axis]].tolist() for name, axis in DIMENSIONS.items() if axis != YEAR},
+    }
+
+
+def etag(*key):
+    # Strong ETag of a response, from the data version and everything the response depends on
+    return f"{cfg.data_version}-{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]}"
+
+
+def cached_tag(request, tag):
+    # The ETag the client has of this response (in any content encoding, see compression.py), or None
+    for candidate in (tag, f"{tag}-gzip", f"{tag}-br"):
+        if request.if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def respond(request, key, build):
+    # JSON response of build() with caching headers, or 304 when the client already has it.
+    # The ETag is taken before build() reads the data: rows added in between (ingest.py swaps the data before the
+    # version) can only make the response newer than its tag, never older.
+    tag = etag(*key)
+    cached = cached_tag(request, tag)
+    if cached is not None:
+        response = flask.Response(status=304)
+        response.set_etag(cached)
+    else:
+        response = flask.jsonify(build())
+        response.set_etag(tag)
+    response.cache_control.public = True
+    response.cache_control.max_age = MAX_AGE
+    return response
@@ -0,0 +1,93 @@
+// Year animation, played entirely in the browser.
+// The server sends the per-year counts for the current filters once (animation_frames store, see
+// plot_functions.animation_frames), every tick of the "animate" interval then only rebuilds the
+// map and line chart data from those arrays here.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    animation: {
+        // Play/Pause button: start from the slider year, hand the reached year back to the slider on pause.
+        // The frames are single or accumulated years, so year range mode disables the button (see toggle_year_range
+        // in main.py) and pauses a running animation, its view is then drawn by the server.
+        toggle: function (n_clicks, year_range, playing_disabled, play_year, slider_year) {
+            const no_update = window.dash_clientside.no_update;
+            const range_mode = (year_range || []).length > 0;
+            if (window.dash_clientside.callback_context.triggered_id === "filter_slct_year_range") {
+                return [range_mode || playing_disabled, no_update, no_update];
+            }
+            if (!n_clicks || range_mode) {
+                return [playing_disabled, no_update, no_update];
+            }
+            if (playing_disabled) {
+                return [false, slider_year, no_update];
+            }
+            return [true, no_update, play_year];
+        },
+
+        step: function (n_intervals, play_year, frames, map_figure, line_figure) {
+            const no_update = window.dash_clientside.no_update;
+            if (!n_intervals || !frames || play_year === null || play_year === undefined) {
+                return [no_update, no_update, no_update, no_update];
+            }
+            const years = frames.years;
+            const year = years[(years.indexOf(play_year) + 1) % years.length];
+            const last = years.indexOf(year);
+            const first = frames.accumulate ? 0 : last;
+
+            // Executions per state and per method in the frame's period
+            const window_sum = function (counts) {
+                const sums = counts[0].map(function () { return 0; });
+                for (let y = first; y <= last; y++) {
+                    counts[y].forEach(function (c, i) { sums[i] += c; });
+                }
+                return sums;
+            };
+
+            // Map: same columns as overview_map (states with no executions are left out)
+            const state_sums = window_sum(frames.state_counts);
+            const locations = [], z = [], customdata = [];
+            frames.states.forEach(function (state, i) {
+                if (state_sums[i] !== 0) {
+                    const log_executions = Math.log(state_sums[i] + 1);
+                    locations.push(state);
+                    z.push(log_executions);
+                    customdata.push([state_sums[i], state, log_executions]);
+                }
+            });
+            let new_map = no_update;
+            if (map_figure && map_figure.data && map_figure.data.length > 0) {
+                const map_trace = Object.assign({}, map_figure.data[0],
+                    {locations: locations, z: z, customdata: customdata, hovertext: locations});
+                new_map = Object.assign({}, map_figure, {data: [map_trace]});
+            }
+
+            // Line chart: executions per method and year, same as overview_plot01
+            const traces = [];
+            frames.methods.forEach(function (method, m) {
+                const x = [], y = [];
+                for (let i = first; i <= last; i++) {
+                    if (frames.method_counts[i][m] !== 0) {
+                        x.push(years[i]);
+                        y.push(frames.method_counts[i][m]);
+                    }
+                }
+                if (x.length > 0) {
+                    traces.push({
+                        type: "scatter", mode: "lines+markers", name: method, legendgroup: method,
+                        showlegend: true, x: x, y: y,
+                        line: {color: frames.method_colors[method], dash: "solid"}, marker: {symbol: "circle"},
+                        hovertemplate: "Execution Method=" + method +
+                            "<br>Execution Year=%{x}<br>Executions=%{y}<extra></extra>",
+                    });
+                }
+            });
+            // The "no data" graph has no axes to reuse
+            const has_axes = line_figure && line_figure.data && line_figure.data.length > 0;
+            const new_line = {data: traces, layout: has_axes ? line_figure.layout : frames.line_layout};
+
+            const title = frames.accumulate
+                ? "Executions from " + years[0] + " - " + year + " in the USA"
+                : "Executions in " + year + " in the USA";
+            return [year, new_map, new_line, title];
+        },
+    },
+});
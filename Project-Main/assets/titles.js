@@ -0,0 +1,69 @@
+// Card titles, built in the browser.
+// They only depend on the year inputs, the clicked state and the number of executions, the server sends
+// the latter with the execution list (state_count store, see update_state_list in main.py).
+
+(function () {
+    // "from 1977 - 2005" / "from 1990 - 2005" / "in 2005"
+    const period = function (year, accumulate, first_year) {
+        if (first_year !== null && first_year !== undefined) {
+            return "from " + first_year + " - " + year;
+        }
+        if (accumulate) {
+            return "from 1977 - " + year;
+        }
+        return "in " + year;
+    };
+
+    // Last year, accumulate toggle and first year (year range mode) of the year inputs, as in Query.from_inputs
+    const period_inputs = function (year, year_acc, year_range, range) {
+        if (year_range && year_range.length > 0 && range && range.length > 0) {
+            const sorted = range.map(Number).sort(function (a, b) { return a - b; });
+            return {year: sorted[sorted.length - 1], accumulate: false, first_year: sorted[0]};
+        }
+        return {year: Number(year), accumulate: (year_acc || []).indexOf(1) !== -1, first_year: null};
+    };
+
+    const state_name = function (clickData) {
+        return clickData ? clickData.points[0].location : null;
+    };
+
+    const state_title = function (state) {
+        return state !== null ? " in " + state : "  in the United States of America";
+    };
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        titles: {
+            main_title: function (year, year_acc, year_range, range) {
+                const p = period_inputs(year, year_acc, year_range, range);
+                return "Executions " + period(p.year, p.accumulate, p.first_year) + " in the USA";
+            },
+
+            state_titles: function (clickData, year, year_acc, year_range, range) {
+                const p = period_inputs(year, year_acc, year_range, range);
+                const state = state_name(clickData);
+                const in_period = period(p.year, p.accumulate, p.first_year);
+
+                const h_racial = "Racial/Gender Distribution of Executions " + in_period + state_title(state);
+                let h_method = "Choose a state to view executions";
+                let h_counties = "Choose a state to view its counties";
+                if (state !== null) {
+                    h_method = "Distribution of Execution Methods " + in_period + state_title(state);
+                    h_counties = "Executions per County " + in_period + state_title(state);
+                }
+                const h_timeline = "Executions per Year (" + (p.first_year || 1977) + " - " + p.year + ") in " +
+                    (state || "the United States of America");
+                const h_victims = "Victims by Race " + in_period + state_title(state);
+                return [h_racial, h_method, h_timeline, h_victims, h_counties];
+            },
+
+            // count: {"executions", "year", "accumulate", "first_year", "state"} of the listed selection
+            list_title: function (count) {
+                if (!count) {
+                    return window.dash_clientside.no_update;
+                }
+                return count.executions + " Executions " + period(count.year, count.accumulate, count.first_year) +
+                    state_title(count.state);
+            },
+        },
+    });
+})();
@@ -0,0 +1,259 @@
+## Benchmark
+# Latency of every plot function and every server callback over a grid of filter states:
+# all years, both accumulate modes, subsets of the gender/race/method checklists and a sample of states.
+# Callbacks are called through the Dash HTTP endpoint (Flask test client), so their numbers include
+# serialization. The figure cache is cleared before every call unless --warm is given, and without --warm the figure
+# store (figstore.py) points to an empty directory, so cold calls render instead of reading warmed figures.
+#
+#   python benchmark.py                  run and print p50/p95/p99 and throughput
+#   python benchmark.py --save           also store the results as the baseline
+#   python benchmark.py --compare        compare against the baseline, exit 1 on a regression
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import figstore
+import main
+import plot_functions
+from cache import cache
+from query import Query
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+GENDERS = ["Male", "Female"]
+RACES = ["Asian", "Black", "Latino", "White", "Other"]
+METHODS = ["Firing Squad", "Electrocution", "Gas", "Hanging", "Lethal Injection"]
+
+# Representative checklist selections: everything, one box off, a narrow selection and nothing
+CHECKLISTS = [
+    (GENDERS, RACES, METHODS),
+    (["Male"], RACES, METHODS),
+    (GENDERS, ["Black", "White"], ["Lethal Injection", "Electrocution"]),
+    (["Female"], ["White"], ["Lethal Injection"]),
+    ([], RACES, METHODS),
+]
+STATES = [None, "Texas", "Virginia", "Ohio", "Utah", "Connecticut", "Maine"]
+
+# Plot functions and whether they depend on the state
+PLOT_FUNCTIONS = {
+    "overview_map": False,
+    "overview_map_patch": False,
+    "overview_plot01": False,
+    "animation_frames": False,
+    "state_zoom": True,
+    "exec_counter": True,
+    "execute_list": True,
+    "state_plot01": True,
+    "state_plot02": True,
+    "state_plot03": True,
+    "state_plot04": True,
+    "state_counties": True,
+}
+
+
+def grid(with_state):
+    years = range(1977, 2022)
+    states = STATES if with_state else [None]
+    for year, acc, checklists, state in itertools.product(years, ([1], []), CHECKLISTS, states):
+        yield year, acc, checklists, state
+
+
+def sample(points, n, seed):
+    points = list(points)
+    if n and len(points) > n:
+        points = random.Random(seed).sample(points, n)
+    return points
+
+
+def run_function(name, points, warm):
+    # Seconds per call, plus the number of calls that raised
+    function = getattr(plot_functions, name)
+    timings, errors = [], 0
+    for year, acc, (gender, race, methods), state in points:
+        query = Query.from_inputs(year, acc, gender, race, methods, state)
+        if name == "state_zoom" and state is None:
+            continue
+        if not warm:
+            cache.clear()
+        start = time.perf_counter()
+        try:
+            function(query)
+        except Exception:
+            errors += 1
+            continue
+        timings.append(time.perf_counter() - start)
+    return timings, errors
+
+
+## Callbacks
+
+def server_callbacks():
+    # (name, dependency) of every server-side callback of the app
+    client = main.app.server.test_client()
+    dependencies = client.get("/_dash-dependencies").get_json()
+    callbacks = []
+    for dependency in dependencies:
+        if dependency.get("clientside_function"):
+            continue
+        callback = main.app.callback_map.get(dependency["output"], {}).get("callback")
+        name = getattr(callback, "__name__", dependency["output"])
+        callbacks.append((name, dependency))
+    return client, callbacks
+
+
+def component_values(year, acc, checklists, state):
+    gender, race, methods = checklists
+    query = Query.from_inputs(year, acc, gender, race, methods)
+    return {
+        "filter_slct_year.value": year,
+        "filter_slct_year_acc.value": acc,
+        "filter_gender.value": gender,
+        "filter_race.value": race,
+        "filter_methods.value": methods,
+        "filter_slct_year_range.value": [],
+        "filter_slct_range.value": [1990, 2005],
+        "execution_map.clickData": {"points": [{"location": state}]} if state else None,
+        "state_data_list02.page_current": 0,
+        "state_data_list02.sort_by": [],
+        "selection.data": {"query": query.to_dict(), "initial": False},
+        # A map is already shown, later overview updates only patch it
+        "map_drawn.data": True,
+    }
+
+
+def parse_outputs(output):
+    # "..a.b...c.d.." (several outputs) or "a.b" (one output), "@<hash>" marks allow_duplicate outputs
+    def parse(spec):
+        component_id, component_property = spec.split("@")[0].rsplit(".", 1)
+        return {"id": component_id, "property": component_property}
+    if output.startswith(".."):
+        return [parse(spec) for spec in output[2:-2].split("...")]
+    return parse(output)
+
+
+def run_callback(client, dependency, points, warm):
+    timings, errors = [], 0
+    for point in points:
+        values = component_values(*point)
+        payload = {
+            "output": dependency["output"],
+            "outputs": parse_outputs(dependency["output"]),
+            "inputs": [dict(i, value=values.get(f"{i['id']}.{i['property']}")) for i in dependency["inputs"]],
+            "state": [dict(s, value=values.get(f"{s['id']}.{s['property']}")) for s in dependency["state"]],
+            # Simulate a user interaction (not the initial call)
+            "changedPropIds": [f"{dependency['inputs'][0]['id']}.{dependency['inputs'][0]['property']}"],
+        }
+        if not warm:
+            cache.clear()
+        start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=payload)
+        if response.status_code not in (200, 204):
+            errors += 1
+            continue
+        timings.append(time.perf_counter() - start)
+    return timings, errors
+
+
+## Report
+
+def summarize(timings, errors):
+    ms = np.asarray(timings or [0.0]) * 1000
+    return {
+        "calls": len(timings),
+        "errors": errors,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "throughput_per_s": float(len(timings) / (ms.sum() / 1000)) if ms.sum() else 0.0,
+    }
+
+
+def print_table(results, baseline=None):
+    print(f"{'name':<34}{'calls':>7}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'calls/s':>10}"
+          + (f"{'p50 vs base':>14}" if baseline else ""))
+    for name, row in results.items():
+        line = (f"{name:<34}{row['calls']:>7}{row['errors']:>7}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}"
+                f"{row['throughput_per_s']:>10.0f}")
+        if baseline and baseline.get(name, {}).get("p50_ms"):
+            line += f"{row['p50_ms'] / baseline[name]['p50_ms'] - 1:>+14.0%}"
+        print(line)
+
+
+def regressions(results, baseline, tolerance):
+    # Names with more failing calls, or whose p50 or p95 got slower than the baseline by more than tolerance (and by at least 0.1 ms)
+    slower = []
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if row["errors"] > base.get("errors", 0):
+            slower.append(f"{name} errors: {base.get('errors', 0)} -> {row['errors']}")
+        for key in ("p50_ms", "p95_ms"):
+            if row[key] > base[key] * (1 + tolerance) and row[key] - base[key] > 0.1:
+                slower.append(f"{name} {key}: {base[key]:.2f} -> {row[key]:.2f}")
+    return slower
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the plot functions and callbacks")
+    parser.add_argument("--sample", type=int, default=200, help="grid points per function (0 = full grid)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm", action="store_true", help="keep the figure cache between calls")
+    parser.add_argument("--only", help="comma separated function/callback names")
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="compare against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown for --compare")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+    only = set(args.only.split(",")) if args.only else None
+    if not args.warm:
+        figstore.STORE_DIR = tempfile.mkdtemp(prefix="figstore-")
+        figstore.stored_keys.cache_clear()
+
+    results = {}
+    for name, with_state in PLOT_FUNCTIONS.items():
+        if only and name not in only:
+            continue
+        points = sample(grid(with_state), args.sample, args.seed)
+        results[name] = summarize(*run_function(name, points, args.warm))
+
+    client, callbacks = server_callbacks()
+    for name, dependency in callbacks:
+        if only and name not in only:
+            continue
+        points = sample(grid(True), args.sample, args.seed)
+        results[f"callback:{name}"] = summarize(*run_callback(client, dependency, points, args.warm))
+
+    if not args.warm:
+        shutil.rmtree(figstore.STORE_DIR, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    if args.save:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"sample": args.sample, "seed": args.seed, "warm": args.warm, "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+
+    if baseline is not None:
+        slower = regressions(results, baseline, args.tolerance)
+        for line in slower:
+            print("REGRESSION", line)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
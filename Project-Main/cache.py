@@ -0,0 +1,96 @@
+## Figure Cache
+# Size-bounded LRU memoization for the plot functions.
+# The cache is bounded by number of entries and by the bytes of the array results (anything with nbytes, e.g. the
+# row orders of the execution list), which grow with the data while figures do not.
+# The plot functions are keyed on their Query (see query.py). Queries are frozen and their checklist values
+# are sorted, so equal selections hit the same entry, whatever order the boxes were ticked in.
+# Keys also hold the data version (cfg.data_version): results of a call that was still running when rows were
+# added (see ingest.py) are stored under the old version and never returned for the new data.
+
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import cfg
+
+
+def entry_bytes(value):
+    # Bytes counted against maxbytes: the size of arrays, other results only count as an entry
+    return int(getattr(value, "nbytes", 0))
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, maxbytes=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.entries = OrderedDict()
+        # Bytes of the array results in entries
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        size = entry_bytes(value)
+        if self.maxbytes is not None and size > self.maxbytes:
+            # Would evict everything else
+            return
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= entry_bytes(self.entries[key])
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            self.nbytes += size
+            while len(self.entries) > self.maxsize or (self.maxbytes is not None and self.nbytes > self.maxbytes):
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= entry_bytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "bytes": self.nbytes,
+                "maxbytes": self.maxbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def memoize(self):
+        # Decorator for functions of a Query (plus any other hashable arguments). The function name is part of
+        # the key, so one cache serves every plot function.
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args):
+                key = (function.__name__, cfg.data_version) + args
+                missing = object()
+                result = self.get(key, missing)
+                if result is missing:
+                    result = function(*args)
+                    self.set(key, result)
+                return result
+            return wrapper
+        return decorator
+
+
+# Shared by all plot functions
+cache = LRUCache(maxsize=1024, maxbytes=256 * 2 ** 20)
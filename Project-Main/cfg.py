@@ -1,27 +1,98 @@
 ## Data Import and Transformation
 
+import os
 import pandas as pd
-import json
-from urllib.request import urlopen
 from plotly.validator_cache import ValidatorCache
 from plotly.graph_objects import Layout
+from aggregates import CountCube, frame_axes, count_rows, prefix_sums, VICTIM_COLUMNS, CUBE_VERSION
+from names import NameStore, NAME_COLUMNS
+from geo import states_url, state_shapes
+import snapshot
 
 # Execution Data
-Data = pd.read_csv('DPIC Execution Database - U.S. Executions.csv', encoding='utf-8', sep=',')
-
-# Convert columns to correct types
-Data = Data.rename(columns={"Execution Date": "Execution Year"})
-Data["Execution Year"] = pd.DatetimeIndex(Data['Execution Year']).year
-Data["Suffix"] = Data["Suffix"].astype("category")
-Data.loc[(Data.Race == 'American Indian or Alaska Native'),'Race']='Other Race'
-Data.loc[(Data.Race == 'Other Race'),'Race']='Other'
-Data["Race"] = Data["Race"].astype("category")
-Data["Sex"] = Data["Sex"].astype("category")
-Data["State"] = Data["State"].astype("category")
-Data["County"] = Data["County"].astype("category")
-Data["Foreign National"] = Data["Foreign National"].astype("category")
-Data["Execution Method"] = Data["Execution Method"].astype("category")
-Data["Execution Volunteer"] = Data["Execution Volunteer"].astype("category")
+# EXECUTIONS_CSV points the dashboard to another file with the same columns (e.g. synthetic data, see synth.py)
+DATA_CSV = os.environ.get("EXECUTIONS_CSV") or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'DPIC Execution Database - U.S. Executions.csv')
+
+
+# Columns stored as unsigned integers: years and victim counts
+INT_COLUMNS = ["Execution Year", "Number of Victims"] + VICTIM_COLUMNS
+
+
+def read_csv(path):
+    return transform(pd.read_csv(path, encoding='utf-8', sep=',')).reset_index(drop=True)
+
+
+def invalid_rows(Data):
+    # Rows with a missing (or unreadable), negative or fractional year or victim count, they have no integer value
+    values = Data[INT_COLUMNS]
+    return ~((values >= 0) & (values % 1 == 0)).all(axis=1).to_numpy()
+
+
+def transform(Data, strict=False):
+    # Convert columns to correct types (also used for appended rows, see ingest.py).
+    # Invalid rows (see invalid_rows) raise ValueError when strict, otherwise they are skipped.
+    Data = Data.rename(columns={"Execution Date": "Execution Year"})
+    Data["Execution Year"] = pd.to_datetime(Data['Execution Year'], errors="coerce").dt.year
+    for col in INT_COLUMNS[1:]:
+        Data[col] = pd.to_numeric(Data[col], errors="coerce")
+    invalid = invalid_rows(Data)
+    if invalid.any():
+        message = f"{invalid.sum()} rows without a valid execution date or number of victims"
+        if strict:
+            raise ValueError(message)
+        print(f"Skipped {message}")
+        Data = Data[~invalid].copy()
+    Data["Suffix"] = Data["Suffix"].astype("category")
+    Data.loc[(Data.Race == 'American Indian or Alaska Native'),'Race']='Other Race'
+    Data.loc[(Data.Race == 'Other Race'),'Race']='Other'
+    Data["Race"] = Data["Race"].astype("category")
+    Data["Sex"] = Data["Sex"].astype("category")
+    Data["State"] = Data["State"].astype("category")
+    Data["County"] = Data["County"].astype("category")
+    Data["Foreign National"] = Data["Foreign National"].astype("category")
+    Data["Execution Method"] = Data["Execution Method"].astype("category")
+    Data["Execution Volunteer"] = Data["Execution Volunteer"].astype("category")
+    # Smallest types that fit: years and victim counts as the smallest unsigned integers that hold every value
+    # (uint16 and uint8 for the DPIC data), names as categories (every distinct name is kept once, the rows hold int16
+    # codes)
+    for col in INT_COLUMNS:
+        Data[col] = pd.to_numeric(Data[col], downcast="unsigned")
+    for col in NAME_COLUMNS:
+        Data[col] = Data[col].astype("category")
+    return Data
+
+
+# Columns the views read (plot functions, count cubes, county index), the others are not loaded.
+# The names are only read by the execution list and kept apart (see names.py), the victim columns only go into the
+# victim cube.
+VIEW_COLUMNS = ["Execution Year", "State", "County", "Sex", "Race", "Execution Method", "Number of Victims"]
+
+# Parsed once, later starts memory-map the typed snapshot (see snapshot.py)
+table = snapshot.load(DATA_CSV, read_csv, VIEW_COLUMNS + NAME_COLUMNS + VICTIM_COLUMNS)
+Data = table[VIEW_COLUMNS]
+names = NameStore(table[NAME_COLUMNS])
+
+# Version of the loaded data, for the figure store (see figstore.py): the CSV's hash, and the number of rows once rows
+# are added while running (see ingest.py)
+csv_version = snapshot.csv_version(DATA_CSV)
+data_version = csv_version
+
+# Execution counts by year, state, sex, race and method, memory-mapped from the snapshot like Data
+cube_years, cube_labels = frame_axes(Data)
+cube_counts = snapshot.load_array(DATA_CSV, "cube-counts", lambda: count_rows(Data, cube_years, cube_labels),
+                                  CUBE_VERSION)
+cube = CountCube(cube_counts, cube_years, cube_labels,
+                 snapshot.load_array(DATA_CSV, "cube-cumulative", lambda: prefix_sums(cube_counts), CUBE_VERSION))
+
+# Victims by race and sex (VICTIM_COLUMNS) summed over the same cells, for the victim panel
+victim_counts = snapshot.load_array(DATA_CSV, "victim-counts",
+                                    lambda: count_rows(table, cube_years, cube_labels, VICTIM_COLUMNS), CUBE_VERSION)
+victim_cube = CountCube(victim_counts, cube_years, cube_labels,
+                        snapshot.load_array(DATA_CSV, "victim-cumulative", lambda: prefix_sums(victim_counts),
+                                            CUBE_VERSION),
+                        VICTIM_COLUMNS)
+del table
 
 Data_dummy  = {'ERROR': ["You", "NOT"], 'ERROR': ["Should", "see this"]}
 Data_dummy = pd.DataFrame(data=Data_dummy)
@@ -30,10 +101,11 @@ Data_dummy = pd.DataFrame(data=Data_dummy)
 # Data = Data.drop("County", axis=1)
 
 
-# State FIPS Data
-with urlopen(
-        'https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json') as response:
-    states_geojson = json.load(response)
+# State FIPS Data (bundled in geodata/, see geo.py)
+# Simplified outlines for the overview map, loaded by the browser.
+# The picture-in-picture state map only carries the outline of its state, split with its bounds at start-up.
+states_geojson_map_url = states_url("map")
+states_pip_shapes = state_shapes("pip")
 
 #"No data availiable" Graph
 null_graph = {
@@ -0,0 +1,43 @@
+## Response Compression
+# JSON responses (callback updates, layout, geometry) are compressed with brotli when the browser accepts it and the
+# brotli package is installed, with gzip otherwise. Figures compress well, mostly repeated layout and template keys.
+# Dash's own compress option needs flask-compress, this only needs the standard library.
+
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller responses are sent as they are
+MIN_SIZE = 1024
+# Fast settings, callbacks are latency bound
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+
+def compress_response(request, response):
+    # Compress response in place if the client accepts it, for use in an after_request hook
+    if (response.status_code != 200 or response.direct_passthrough or "Content-Encoding" in response.headers
+            or response.mimetype != "application/json"):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers["Content-Encoding"] = "gzip"
+    else:
+        return response
+    # A strong ETag names exactly these bytes, the compressed response gets its own (see api.py)
+    tag, weak = response.get_etag()
+    if tag and not weak:
+        response.set_etag(f"{tag}-{response.headers['Content-Encoding']}")
+    return response
@@ -0,0 +1,175 @@
+## Figure Store
+# Figures and list pages of the plot functions, stored on disk as JSON so that new worker processes do not start cold.
+# Entries are keyed by function and arguments (the Query, see query.py) under a directory per dataset version
+# (cfg.data_version) and code version (CODE_VERSION): a new CSV, added rows (see ingest.py) or a change to the code or
+# outlines the figures are built from use a new directory.
+# The plot functions look here after the in-process cache (see cache.py) and before computing, for the arguments
+# that were warmed. Only the warm-up writes to the store:
+#   python figstore.py warm [--jobs 8]
+# which stores all years x both accumulate modes x the default checklists, for the national view and every state.
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+from functools import wraps, lru_cache
+from multiprocessing import Pool
+
+from plotly.io.json import to_json_plotly, from_json_plotly
+
+import cfg
+from geo import GEO_DIR
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(PROJECT_DIR, ".figstore")
+# Bumped when the format of the entries changes
+STORE_FORMAT = 1
+# Modules the stored figures are built from (with every file in geodata/, e.g. the outlines state_zoom inlines)
+CODE_SOURCES = ["plot_functions.py", "aggregates.py", "query.py", "cfg.py", "names.py", "geo.py"]
+
+
+def code_version():
+    # Changes with the sources, figures stored by an older version are not read
+    paths = [os.path.join(PROJECT_DIR, name) for name in CODE_SOURCES]
+    for root, dirs, files in os.walk(GEO_DIR):
+        dirs.sort()
+        paths += [os.path.join(root, name) for name in sorted(files)]
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(os.path.relpath(path, PROJECT_DIR).encode("utf-8"))
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return f"{STORE_FORMAT}-{digest.hexdigest()[:12]}"
+
+
+CODE_VERSION = code_version()
+
+
+def version_dir():
+    return os.path.join(STORE_DIR, f"{cfg.data_version}-{CODE_VERSION}")
+
+
+@lru_cache(maxsize=None)
+def stored_keys(directory):
+    # Entry files of a function directory, listed once per process: entries are only added by the warm-up, a server
+    # started before it finished reads them after a restart
+    try:
+        return frozenset(os.listdir(directory))
+    except FileNotFoundError:
+        return frozenset()
+
+
+def entry_path(name, args):
+    key = hashlib.sha1(repr(args).encode("utf-8")).hexdigest()
+    return os.path.join(version_dir(), name, f"{key}.json")
+
+
+def read(name, args):
+    # Arguments that were not warmed (e.g. other filters) are not looked up on disk
+    path = entry_path(name, args)
+    if os.path.basename(path) not in stored_keys(os.path.dirname(path)):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return from_json_plotly(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def write(name, args, value):
+    path = entry_path(name, args)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(to_json_plotly(value))
+    os.replace(tmp_path, path)
+
+
+def stored():
+    # Decorator for plot functions with JSON results: a stored result is returned instead of computing it.
+    # Goes below cache.memoize, so a result read from disk is kept in memory as well.
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args):
+            result = read(function.__name__, args)
+            if result is None:
+                result = function(*args)
+            return result
+        wrapper.compute = function
+        return wrapper
+    return decorator
+
+
+## Warm-up
+
+# Gender, race and method values ticked when the dashboard opens (main.py), also the defaults of the API (api.py)
+DEFAULT_CHECKLISTS = (["Male", "Female"],
+                      ["Asian", "Black", "Latino", "White", "Other"],
+                      ["Firing Squad", "Electrocution", "Gas", "Hanging", "Lethal Injection"])
+
+
+def warm_calls():
+    # (function name, args) of the views behind the default filters, built the way the callbacks in main.py build
+    # their queries
+    from query import Query
+    import plot_functions as pf
+
+    states = [None] + list(cube_states())
+    for accumulate in ([1], []):
+        yield "animation_frames", (Query.from_inputs(int(pf.cube.years[-1]), accumulate, *DEFAULT_CHECKLISTS),)
+        for year in range(1977, 2022):
+            national = Query.from_inputs(year, accumulate, *DEFAULT_CHECKLISTS)
+            yield "overview_map", (national,)
+            yield "overview_plot01", (national,)
+            for state in states:
+                query = national.with_state(state)
+                yield "state_plot01", (query,)
+                yield "state_plot04", (query,)
+                yield "execute_list", (query, 0, pf.LIST_PAGE_SIZE, ())
+                if state is not None:
+                    yield "state_plot02", (query,)
+                    yield "state_zoom", (query,)
+                    yield "state_counties", (query,)
+                if accumulate:
+                    # The timeline ignores the accumulate toggle
+                    yield "state_plot03", (Query.from_inputs(year, None, *DEFAULT_CHECKLISTS, state),)
+
+
+def cube_states():
+    import plot_functions as pf
+    return pf.cube.labels["State"]
+
+
+def warm_one(call):
+    import plot_functions as pf
+    name, args = call
+    try:
+        write(name, args, getattr(pf, name).compute(*args))
+        return True
+    except Exception as e:
+        print(f"{name}{args}: {e}", file=sys.stderr)
+        return False
+
+
+def warm(jobs=1):
+    calls = list(warm_calls())
+    # Entries of older dataset versions are not read any more
+    if os.path.isdir(STORE_DIR):
+        for name in os.listdir(STORE_DIR):
+            if name != os.path.basename(version_dir()):
+                shutil.rmtree(os.path.join(STORE_DIR, name), ignore_errors=True)
+    if jobs > 1:
+        with Pool(jobs) as pool:
+            results = pool.map(warm_one, calls, chunksize=16)
+    else:
+        results = [warm_one(call) for call in calls]
+    print(f"{sum(results)} / {len(calls)} entries stored in {version_dir()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Figure store")
+    parser.add_argument("command", choices=["warm"])
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    warm(args.jobs)
@@ -0,0 +1,55 @@
+## Memory Footprint
+# Size of the execution table as the dashboard keeps it (cfg.Data and the name store), per column, against the whole
+# CSV as pandas reads it by default (all columns, int64 numbers, one string object per text cell):
+#   python footprint.py
+# Columns memory-mapped from the snapshot (see snapshot.py) are marked, their pages are shared by all processes.
+
+import numpy as np
+import pandas as pd
+
+import cfg
+
+# Column names of the CSV that the dashboard renames
+RENAMED = {"Execution Date": "Execution Year"}
+
+
+def is_mapped(series):
+    values = series.array.codes if isinstance(series.dtype, pd.CategoricalDtype) else series.to_numpy()
+    while values is not None and not isinstance(values, np.memmap):
+        values = getattr(values, "base", None)
+    return values is not None
+
+
+def megabytes(size):
+    return f"{size / 2 ** 20:9.2f}"
+
+
+def report():
+    before = pd.read_csv(cfg.DATA_CSV, encoding="utf-8", sep=",")
+    kept = dict(cfg.Data.items())
+    kept.update(cfg.names.names.items())
+
+    print(f"{len(before)} rows of {cfg.DATA_CSV}")
+    print(f"{'column':42} {'before':>10} {'MB':>9}   {'after':>10} {'MB':>9}")
+    for col in before.columns:
+        size = before[col].memory_usage(deep=True, index=False)
+        line = f"{col:42} {str(before[col].dtype):>10} {megabytes(size)}   "
+        series = kept.get(RENAMED.get(col, col))
+        if series is None:
+            line += f"{'-':>10}"
+        else:
+            dtype = f"cat/{series.array.codes.dtype}" if isinstance(series.dtype, pd.CategoricalDtype) else str(series.dtype)
+            line += f"{dtype:>10} {megabytes(series.memory_usage(deep=True, index=False))}"
+            line += "  mapped" if is_mapped(series) else ""
+        print(line)
+
+    total_before = before.memory_usage(deep=True, index=False).sum()
+    total_after = sum(series.memory_usage(deep=True, index=False) for series in kept.values())
+    print(f"{'total':42} {'':>10} {megabytes(total_before)}   {'':>10} {megabytes(total_after)}"
+          f"  ({total_before / total_after:.1f}x smaller)")
+    print(f"{'per row (bytes)':42} {'':>10} {total_before / len(before):9.1f}   {'':>10} "
+          f"{total_after / len(cfg.Data):9.1f}")
+
+
+if __name__ == '__main__':
+    report()
@@ -0,0 +1,239 @@
+## Geometry
+# US state outlines are shipped with the project (geodata/), so nothing is downloaded at start-up.
+# Every file is a pre-simplified level of the same outlines, smaller levels are used where the map
+# is drawn smaller:
+#   map  - overview map
+#   pip  - picture-in-picture state map
+# County outlines (for the county map of a state) are split into one file per state, geodata/counties/<STATEFP>.json,
+# and only read when a state is drilled into (load_counties).
+#
+# The files are built from the US Census Bureau cartographic boundary shapefiles
+# (cb_2016_us_state_500k and cb_2016_us_county_500k, public domain, also shipped in the plotly-geo package):
+#   python geo.py path/to/cb_2016_us_state_500k.shp [path/to/cb_2016_us_county_500k.shp]
+# Building needs pyshp (pip install pyshp), loading only needs the json module.
+# The maps reference the outlines by URL (states_url, load_counties), the browser downloads every file once.
+
+import hashlib
+import json
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+GEO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geodata")
+
+# level -> (simplification tolerance in degrees, decimals kept, smallest polygon kept in square degrees)
+STATE_LEVELS = {
+    "map": (0.02, 3, 0.005),
+    "pip": (0.06, 2, 0.02),
+}
+
+# Same as STATE_LEVELS, for the county outlines
+COUNTY_LEVEL = (0.005, 3, 0.0002)
+
+# Census FIPS codes of the territories that are not part of the data (Puerto Rico and DC are kept)
+SKIP_STATEFP = {"60", "66", "69", "78"}
+
+# Name suffix of the county types (Census LSAD codes), county names are then as in the data, e.g. "Harris County",
+# "Orleans Parish" or "Richmond city"
+COUNTY_LSAD = {"03": "City and Borough", "04": "Borough", "05": "Census Area", "06": "County", "12": "Municipality",
+               "13": "Municipio", "15": "Parish", "25": "city"}
+COUNTY_DIR = os.path.join(GEO_DIR, "counties")
+
+
+def states_path(level):
+    return os.path.join(GEO_DIR, f"us-states-{level}.json")
+
+
+def load_states(level):
+    with open(states_path(level), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def states_url(level):
+    # URL of a level as served by main.py. The content hash in the query string changes with the file,
+    # so browsers can cache it indefinitely.
+    with open(states_path(level), "rb") as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:12]
+    return f"/geodata/{os.path.basename(states_path(level))}?v={digest}"
+
+
+def feature_bounds(feature):
+    # ([lon_min, lon_max], [lat_min, lat_max]) of a Polygon or MultiPolygon feature
+    geometry = feature["geometry"]
+    polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+    points = np.concatenate([np.asarray(ring, dtype=float) for polygon in polygons for ring in polygon])
+    lon, lat = points[:, 0], points[:, 1]
+    # Outlines across the antimeridian (the Aleutians) are bounded west of it
+    if lon.max() - lon.min() > 180:
+        lon = np.where(lon > 0, lon - 360, lon)
+    return [float(lon.min()), float(lon.max())], [float(lat.min()), float(lat.max())]
+
+
+@lru_cache(maxsize=None)
+def state_shapes(level="pip"):
+    # State name -> (GeoJSON with the outline of that state only, its bounds), for maps of a single state.
+    # Split once from the outlines of a level, a map of one state then only carries that state.
+    shapes = {}
+    for feature in load_states(level)["features"]:
+        geojson = {"type": "FeatureCollection", "features": [feature]}
+        shapes[feature["properties"]["name"]] = geojson, feature_bounds(feature)
+    return shapes
+
+
+def counties_path(statefp):
+    return os.path.join(COUNTY_DIR, f"{statefp}.json")
+
+
+@lru_cache(maxsize=None)
+def county_index():
+    # State name -> STATEFP of the county files
+    with open(os.path.join(COUNTY_DIR, "index.json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def load_counties(state):
+    # URL (as served by main.py, with a content hash like states_url) and county names of the county outlines of a
+    # state, None for states without county outlines. Read on first use, the outlines are not kept.
+    statefp = county_index().get(state)
+    if statefp is None:
+        return None
+    with open(counties_path(statefp), "rb") as f:
+        content = f.read()
+    names = tuple(feature["properties"]["name"] for feature in json.loads(content)["features"])
+    url = f"/geodata/counties/{statefp}.json?v={hashlib.sha1(content).hexdigest()[:12]}"
+    return url, names
+
+
+## Build step
+
+def simplify_ring(ring, tolerance):
+    # Douglas-Peucker simplification of a closed ring (first point == last point)
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[0] = keep[-1] = True
+    # The closing point equals the start point, so split the ring at its farthest point first
+    far = int(np.argmax(((ring - ring[0]) ** 2).sum(axis=1)))
+    keep[far] = True
+    stack = [(0, far), (far, len(ring) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = ring[first], ring[last]
+        points = ring[first + 1:last]
+        segment = end - start
+        length = np.hypot(*segment)
+        if length == 0:
+            dist = np.hypot(*(points - start).T)
+        else:
+            dist = np.abs(segment[0] * (points[:, 1] - start[1]) - segment[1] * (points[:, 0] - start[0])) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return ring[keep]
+
+
+def ring_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1))) / 2
+
+
+def simplify_polygons(polygons, tolerance, decimals, min_area):
+    # polygons: list of polygons, each a list of rings (outer ring first)
+    polygons = sorted(polygons, key=lambda rings: -ring_area(np.asarray(rings[0])))
+    result = []
+    for n, rings in enumerate(polygons):
+        outer = np.asarray(rings[0], dtype=float)
+        # Always keep the largest polygon, drop small islands
+        if n > 0 and ring_area(outer) < min_area:
+            continue
+        simplified = []
+        for ring in rings:
+            ring = simplify_ring(np.asarray(ring, dtype=float), tolerance).round(decimals)
+            # Remove points that became duplicates after rounding
+            ring = ring[np.r_[True, np.any(np.diff(ring, axis=0) != 0, axis=1)]]
+            if len(ring) >= 4:
+                simplified.append(ring.tolist())
+        if simplified and len(simplified[0]) >= 4:
+            result.append(simplified)
+    return result
+
+
+def shape_polygons(shape):
+    # Split a shapefile polygon (one list of points with part offsets) into polygons with holes.
+    # Shapefile outer rings are clockwise, holes counter-clockwise.
+    parts = list(shape.parts) + [len(shape.points)]
+    polygons = []
+    for first, last in zip(parts[:-1], parts[1:]):
+        ring = np.asarray(shape.points[first:last], dtype=float)
+        x, y = ring[:, 0], ring[:, 1]
+        clockwise = np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)) > 0
+        if clockwise or not polygons:
+            polygons.append([ring])
+        else:
+            polygons[-1].append(ring)
+    return polygons
+
+
+def feature(feature_id, properties, polygons):
+    if len(polygons) == 1:
+        geometry = {"type": "Polygon", "coordinates": polygons[0]}
+    else:
+        geometry = {"type": "MultiPolygon", "coordinates": polygons}
+    return {"type": "Feature", "id": feature_id, "properties": properties, "geometry": geometry}
+
+
+def build_states(shapefile_path):
+    import shapefile  # pyshp, only needed to build
+
+    reader = shapefile.Reader(shapefile_path)
+    records = [(sr.record["STATEFP"], sr.record["NAME"], shape_polygons(sr.shape))
+               for sr in reader.iterShapeRecords() if sr.record["STATEFP"] not in SKIP_STATEFP]
+    records.sort()
+
+    os.makedirs(GEO_DIR, exist_ok=True)
+    for level, (tolerance, decimals, min_area) in STATE_LEVELS.items():
+        features = [feature(statefp, {"name": name}, simplify_polygons(polygons, tolerance, decimals, min_area))
+                    for statefp, name, polygons in records]
+        with open(states_path(level), "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, separators=(",", ":"))
+        print(f"{states_path(level)}: {os.path.getsize(states_path(level)) / 1024:.0f} KB")
+
+
+def build_counties(shapefile_path):
+    import shapefile  # pyshp, only needed to build
+
+    state_names = {feature["id"]: feature["properties"]["name"] for feature in load_states("map")["features"]}
+    states = {}
+    reader = shapefile.Reader(shapefile_path)
+    for sr in reader.iterShapeRecords():
+        statefp = sr.record["STATEFP"]
+        if statefp not in state_names:
+            continue
+        name = sr.record["NAME"]
+        if sr.record["LSAD"] in COUNTY_LSAD:
+            name = f"{name} {COUNTY_LSAD[sr.record['LSAD']]}"
+        states.setdefault(statefp, []).append((sr.record["GEOID"], name, shape_polygons(sr.shape)))
+
+    os.makedirs(COUNTY_DIR, exist_ok=True)
+    tolerance, decimals, min_area = COUNTY_LEVEL
+    for statefp, records in sorted(states.items()):
+        features = [feature(geoid, {"name": name}, simplify_polygons(polygons, tolerance, decimals, min_area))
+                    for geoid, name, polygons in sorted(records)]
+        with open(counties_path(statefp), "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, separators=(",", ":"))
+    with open(os.path.join(COUNTY_DIR, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({state_names[statefp]: statefp for statefp in sorted(states)}, f, indent=0)
+    size = sum(os.path.getsize(counties_path(statefp)) for statefp in states)
+    print(f"{COUNTY_DIR}: {len(states)} states, {size / 1024:.0f} KB")
+
+
+if __name__ == '__main__':
+    build_states(sys.argv[1])
+    if len(sys.argv) > 2:
+        build_counties(sys.argv[2])
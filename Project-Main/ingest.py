@@ -0,0 +1,178 @@
+## Incremental Ingestion
+# New execution records are added while the dashboard runs, without a restart:
+#   - watch(): rows appended to the CSV (cfg.DATA_CSV) are picked up by a background thread
+#   - POST /ingest (see main.py): a JSON list of records with the CSV columns, appended to the CSV and to the data
+# Only the new rows are parsed and transformed (cfg.transform). Their categories are appended to the category
+# dictionaries (existing codes stay valid), the count cubes only count the new rows (CountCube.extended) and the data
+# version changes (cached and stored figures of the old data are not used, see cache.py and figstore.py), so the next
+# callback shows the new data.
+# Appended lines that cannot be read or have invalid or incomplete values are skipped (POST /ingest rejects them).
+# The CSV is assumed to be append-only. The snapshot (snapshot.py) is rebuilt at the next start.
+
+import csv
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import cfg
+import plot_functions
+from aggregates import CUBE_AXES, VICTIM_COLUMNS
+from names import NameStore
+
+# Held while rows are added, appends are applied one after the other
+lock = threading.Lock()
+# Number of bytes of cfg.DATA_CSV already in the data
+csv_offset = os.path.getsize(cfg.DATA_CSV)
+
+
+def csv_columns():
+    with open(cfg.DATA_CSV, encoding="utf-8", newline="") as f:
+        return next(csv.reader(f))
+
+
+def appended(frame, new):
+    # frame with the rows of new appended, and new with the columns and types of frame. New values are appended to
+    # the categories, the codes of the existing rows do not change. The live frame is not changed, callbacks may be
+    # reading it.
+    frame = frame.copy(deep=False)
+    new = new[frame.columns].copy()
+    for col, dtype in frame.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = dtype.categories.append(new[col].cat.categories.difference(dtype.categories))
+            frame[col] = frame[col].cat.set_categories(categories)
+            new[col] = new[col].cat.set_categories(categories)
+        else:
+            # Integer columns are widened when a new value does not fit (see cfg.transform)
+            dtype = np.promote_types(dtype, new[col].dtype)
+            frame[col] = frame[col].astype(dtype)
+            new[col] = new[col].astype(dtype)
+    return pd.concat([frame, new], ignore_index=True), new
+
+
+def incomplete_rows(new):
+    # Transformed rows without a state, sex, race or method (category code -1): the cube has no cell for them
+    return np.logical_or.reduce([new[col].cat.codes.to_numpy() < 0 for col in CUBE_AXES[1:]])
+
+
+def add_rows(raw, strict=False):
+    # Add rows given with the CSV columns (as read by pd.read_csv) to cfg.Data and cfg.cube. Call with lock held.
+    # Invalid (see cfg.transform) and incomplete rows raise ValueError when strict (nothing is added), otherwise they
+    # are skipped.
+    if raw.empty:
+        return 0
+    new = cfg.transform(raw, strict)
+    if new.empty:
+        return 0
+    incomplete = incomplete_rows(new)
+    if incomplete.any():
+        message = f"{incomplete.sum()} rows without {', '.join(CUBE_AXES[1:])}"
+        if strict:
+            raise ValueError(message)
+        print(f"Skipped {message}")
+        new = new[~incomplete]
+        if new.empty:
+            return 0
+    data, new_rows = appended(cfg.Data, new)
+    data_names = NameStore(appended(cfg.names.names, new)[0])
+    # The victim columns are not in Data, the victim cube counts them from the transformed rows
+    new_rows = new_rows.join(new[VICTIM_COLUMNS])
+    data_cube = cfg.cube.extended(new_rows)
+    data_victim_cube = cfg.victim_cube.extended(new_rows)
+    cfg.Data, cfg.names, cfg.cube, cfg.victim_cube = data, data_names, data_cube, data_victim_cube
+    plot_functions.set_data(data, data_names, data_cube, data_victim_cube)
+    # Cached and stored figures of the previous data are not used any more. Changed after the data, so results
+    # computed from the old data are never stored under the new version.
+    cfg.data_version = f"{cfg.csv_version}-{len(data)}"
+    return len(new)
+
+
+def add_records(records):
+    # Append records (dicts with the CSV columns) to the CSV and to the data, returns the number of rows added
+    global csv_offset
+    columns = csv_columns()
+    unknown = {key for record in records for key in record} - set(columns)
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, lineterminator="\n")
+    writer.writerows(records)
+    text = buffer.getvalue()
+    raw = pd.read_csv(io.StringIO(text), header=None, names=columns)
+    with lock:
+        read_appended()
+        added = add_rows(raw, strict=True)
+        with open(cfg.DATA_CSV, "a+b") as f:
+            # Start a new line if the last one is not terminated
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write(text.encode("utf-8"))
+        # Our own rows are not read back by the watcher
+        csv_offset = os.path.getsize(cfg.DATA_CSV)
+    return added
+
+
+def read_appended():
+    # Add the complete lines appended to the CSV since the last read. Call with lock held.
+    global csv_offset
+    size = os.path.getsize(cfg.DATA_CSV)
+    if size < csv_offset:
+        raise RuntimeError(f"{cfg.DATA_CSV} shrank, restart to reload it")
+    if size == csv_offset:
+        return 0
+    with open(cfg.DATA_CSV, "rb") as f:
+        f.seek(csv_offset)
+        block = f.read(size - csv_offset)
+    # A line that is still being written is read next time
+    block = block[:block.rfind(b"\n") + 1]
+    # Lines that cannot be added are skipped, not read again
+    csv_offset += len(block)
+    if not block.strip():
+        return 0
+    try:
+        return add_rows(read_lines(block))
+    except ValueError as e:
+        print(f"Skipped rows appended to {cfg.DATA_CSV}: {e}")
+        return 0
+
+
+def read_lines(block):
+    # Rows of CSV lines (bytes) as read by pd.read_csv. When the block cannot be read as a whole, it is read line by
+    # line and the lines that cannot be read (e.g. with the wrong number of fields) are skipped.
+    columns = csv_columns()
+    try:
+        return pd.read_csv(io.BytesIO(block), header=None, names=columns, encoding="utf-8")
+    except (ValueError, UnicodeDecodeError):
+        pass
+    rows = []
+    for number, line in enumerate(block.splitlines(keepends=True), 1):
+        try:
+            if len(next(csv.reader([line.decode("utf-8")]), [])) != len(columns):
+                raise ValueError(f"expected {len(columns)} fields")
+            rows.append(pd.read_csv(io.BytesIO(line), header=None, names=columns, encoding="utf-8"))
+        except (ValueError, UnicodeDecodeError) as e:
+            print(f"Skipped appended line {number}: {e}")
+    return pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=columns)
+
+
+def watch(interval=10):
+    # Check the CSV for appended rows every interval seconds, in a daemon thread
+    def run():
+        event = threading.Event()
+        while not event.wait(interval):
+            try:
+                with lock:
+                    added = read_appended()
+                if added:
+                    print(f"Added {added} rows from {cfg.DATA_CSV}")
+            except Exception as e:
+                print(f"Could not read appended rows: {e}")
+
+    thread = threading.Thread(target=run, name="ingest-watch", daemon=True)
+    thread.start()
+    return thread
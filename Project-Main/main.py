@@ -2,14 +2,27 @@
 
 import dash
 import dash_bootstrap_components as dbc
+import flask
 import pandas as pd
 import plotly.express as px
 from dash import dcc
 from dash import html
-from dash.dependencies import Input, Output, State
+from dash import dash_table
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import plotly.graph_objects as go
 from plot_functions import *
+import plot_functions
 from cfg import Data, Data_dummy, null_graph, choose_state_graph
+import cfg
+from query import Query
+from cache import cache
+import metrics
+import ingest
+import compression
+import api
+from figstore import DEFAULT_CHECKLISTS
+from geo import GEO_DIR
+import os
 import time
 
 ## Links
@@ -49,11 +62,23 @@ PIP_STYLE = {
 }
 
 
+# Custom marks for the year sliders
+YEAR_MARKS = {
+    1977: "1977",
+    1980: "1980",
+    1990: "1990",
+    2000: "2000",
+    2010: "2010",
+    2021: "2021"}
+
+
 ## Dash
 # Init the app
 app = dash.Dash(external_stylesheets=[dbc.themes.FLATLY,
                                       "assets/custom.css",
                                       "https://fonts.googleapis.com/css2?family=Inter:wght@100;200;300;400;500;600;700;800;900&display=swap"])
+# WSGI entry point for multi-process servers, e.g. gunicorn --workers 8 main:server (see snapshot.py)
+server = app.server
 
 # Define the main navigation bar (filters)
 navbar = html.Div(
@@ -63,7 +88,12 @@ navbar = html.Div(
             dbc.Col(
                 [
                     dcc.Interval(id="animate", disabled=True), # Interval for animation
-                    dcc.Slider(
+                    dcc.Store(id="animation_frames"), # Per-year counts the animation steps through
+                    dcc.Store(id="play_year"), # Year shown by the animation
+                    dcc.Store(id="selection"), # Query of the current filters (see update_selection)
+                    dcc.Store(id="state_count"), # Number of listed executions, for the list title (assets/titles.js)
+                    dcc.Store(id="map_drawn"), # Set once the full overview map was sent (see overview_update)
+                    html.Div(dcc.Slider(
                         id="filter_slct_year",
                         min=1977, # Minimum year
                         max=2021, # Maximum year
@@ -71,14 +101,19 @@ navbar = html.Div(
                         value=2005, # Default value
                         included=False, # Show selection bar between handles
                         tooltip={"placement": "top", "always_visible": True}, # Show tooltip on hover
-                        marks={ # Custom marks for slider
-                            1977: "1977",
-                            1980: "1980",
-                            1990: "1990",
-                            2000: "2000",
-                            2010: "2010",
-                            2021: "2021"}
-                    ), ]
+                        marks=YEAR_MARKS,
+                    ), id="year_slider"),
+                    # Year Range Slider (shown instead of the year slider in year range mode)
+                    html.Div(dcc.RangeSlider(
+                        id="filter_slct_range",
+                        min=1977,
+                        max=2021,
+                        step=1,
+                        value=[1990, 2005],
+                        allowCross=False,
+                        tooltip={"placement": "top", "always_visible": True},
+                        marks=YEAR_MARKS,
+                    ), id="year_range_slider", hidden=True), ]
                 , md=10),
             # Play Button and Accumulate Years Toggle
             dbc.Col(
@@ -91,14 +126,21 @@ navbar = html.Div(
                                            n_clicks=0)
                                 , md=3),
                             dbc.Col(
-                                html.Div(dbc.Checklist(
+                                html.Div([dbc.Checklist(
                                     options=[
                                         {"label": "Accumulate Years", "value": 1},
                                     ],
                                     value=[1],
                                     id="filter_slct_year_acc",
                                     switch=True,
-                                ), style={"margin-top": "7px"}, ), md=9),
+                                ), dbc.Checklist(
+                                    options=[
+                                        {"label": "Year Range", "value": 1},
+                                    ],
+                                    value=[],
+                                    id="filter_slct_year_range",
+                                    switch=True,
+                                )], style={"margin-top": "7px"}, ), md=9),
                         ]),
                 ]
                 , md=2),
@@ -123,7 +165,7 @@ overview_method_filters = html.Div(dbc.Card(
                         {'label': 'Male', 'value': 'Male'},
                         {'label': 'Female', 'value': 'Female'},
                     ],
-                    value=['Male', 'Female'],
+                    value=DEFAULT_CHECKLISTS[0],
                     id="filter_gender",
                     inline=True,
                     switch=True
@@ -137,7 +179,7 @@ overview_method_filters = html.Div(dbc.Card(
                         {'label': 'White', 'value': 'White'},
                         {'label': 'Other', 'value': 'Other'}
                     ],
-                    value=['Asian', 'Black', "Latino", "White", "Other"],
+                    value=DEFAULT_CHECKLISTS[1],
                     id="filter_race",
                     inline=True,
                     switch=True
@@ -151,7 +193,7 @@ overview_method_filters = html.Div(dbc.Card(
                         {'label': 'Hanging', 'value': 'Hanging'},
                         {'label': 'Lethal Injection', 'value': 'Lethal Injection'}
                     ],
-                    value=['Firing Squad', 'Electrocution', "Gas", "Hanging", "Lethal Injection"],
+                    value=DEFAULT_CHECKLISTS[2],
                     id="filter_methods",
                     inline=True,
                     switch=True
@@ -224,10 +266,46 @@ state_data_plot_03 = html.Div(dbc.Card(
     ],
     style={"margin-top": "15px"}))
 
+state_data_plot_04 = html.Div(dbc.Card(
+    [
+        dbc.CardHeader(id="stateVictimTitle", style={"text-align": "left"}),
+        dbc.CardBody(
+            dcc.Graph(
+                id="state_data_plot_04", figure={},
+                style={'width="100%", margin': 'auto auto'},
+            ))
+    ],
+    style={"margin-top": "15px"}))
+
+state_data_counties = html.Div(dbc.Card(
+    [
+        dbc.CardHeader(id="stateCountyTitle", style={"text-align": "left"}),
+        dbc.CardBody(
+            dcc.Graph(
+                id="state_data_counties", figure={},
+                style={'width="100%", margin': 'auto auto'},
+            ))
+    ],
+    style={"margin-top": "15px"}))
+
+# Only the visible page is sent, paging and sorting are done on the server (see execute_list)
 state_data_list_table = html.Div(dbc.Card(
     [
         dbc.CardHeader(id="stateListDataTitle", style={"text-align": "left"}),
-        dbc.CardBody(id="state_data_list02", style={"padding":"0px"})
+        dbc.CardBody(dash_table.DataTable(
+            id="state_data_list02",
+            columns=[{"name": col, "id": col} for col in LIST_COLUMNS],
+            page_action="custom",
+            page_current=0,
+            page_size=LIST_PAGE_SIZE,
+            sort_action="custom",
+            sort_mode="multi",
+            sort_by=[],
+            style_as_list_view=True,
+            style_header={"fontWeight": "600", "backgroundColor": "transparent"},
+            style_cell={"fontFamily": "Inter, sans-serif", "textAlign": "center", "backgroundColor": "transparent"},
+            style_data_conditional=[{"if": {"row_index": "odd"}, "backgroundColor": "rgba(0,0,0,0.05)"}],
+        ), style={"padding":"0px"})
     ],
     style={"margin-top": "15px", "max-height":"720px", "overflow":"auto"},))
 
@@ -273,10 +351,18 @@ app.layout = dbc.Container(
                         ),
                         dbc.Row(
                             dbc.Col(state_data_plot_03, md=12, align="start")
+                        ),
+                        dbc.Row(
+                            dbc.Col(state_data_plot_04, md=12, align="start")
                         )
                         ]
                     , md=6),
-                    dbc.Col(state_data_list_table, align="start", md=6)
+                    dbc.Col(
+                        [
+                            state_data_counties,
+                            state_data_list_table,
+                        ]
+                    , align="start", md=6)
                 ],
                 align="center",
             ),
@@ -290,156 +376,413 @@ app.layout = dbc.Container(
 
 
 ## Animate Year
-
+# The animation runs in the browser (assets/animation.js): every tick redraws the map, the line chart and the title
+# from the animation_frames store. The slider only gets the reached year (and the server callbacks run) on pause.
 
 @app.callback(
-    Output("filter_slct_year", "value"),
+    Output("animation_frames", "data"),
     [
-        Input("animate", "n_intervals"),
-        Input("filter_slct_year", "value"),
+        Input("filter_slct_year_acc", "value"),
+        Input("filter_gender", "value"),
+        Input("filter_race", "value"),
+        Input("filter_methods", "value"),
     ],
-    prevent_initial_call=True,
 )
+@metrics.timed
+def update_animation_frames(filter_slct_year_acc, filter_gender, filter_race, filter_methods):
+    # The frames cover every year, the query year is fixed so that all slider positions share one cache entry
+    query = Query.from_inputs(plot_functions.cube.years[-1], filter_slct_year_acc, filter_gender, filter_race,
+                              filter_methods)
+    return animation_frames(query)
 
 
-def update_figure(n, selected_year):
-    if n:
-        years = range(1977, 2022)
-        year = years[(selected_year - 1977 + 1) % len(years)]
-    else:
-        year = selected_year
-    return year
-
-
+app.clientside_callback(
+    ClientsideFunction(namespace="animation", function_name="toggle"),
+    [
+        Output("animate", "disabled"),
+        Output("play_year", "data"),
+        Output("filter_slct_year", "value"),
+    ],
+    [
+        Input("play", "n_clicks"),
+        Input("filter_slct_year_range", "value"),
+    ],
+    [
+        State("animate", "disabled"),
+        State("play_year", "data"),
+        State("filter_slct_year", "value"),
+    ],
+)
 
-@app.callback(
-    Output("animate", "disabled"),
-    Input("play", "n_clicks"),
-    State("animate", "disabled"),
+app.clientside_callback(
+    ClientsideFunction(namespace="animation", function_name="step"),
+    [
+        Output("play_year", "data", allow_duplicate=True),
+        Output("execution_map", "figure", allow_duplicate=True),
+        Output("overview_sidebar_plot_01", "figure", allow_duplicate=True),
+        Output("nationalTitle", "children", allow_duplicate=True),
+    ],
+    Input("animate", "n_intervals"),
+    [
+        State("play_year", "data"),
+        State("animation_frames", "data"),
+        State("execution_map", "figure"),
+        State("overview_sidebar_plot_01", "figure"),
+    ],
+    prevent_initial_call=True,
 )
-def toggle(n, playing):
-    if n:
-        return not playing
-    return playing
 
 
-## Update Overview
+## Year Range Mode
 @app.callback(
     [
-        Output(component_id="execution_map", component_property="figure"),
-        Output(component_id="overview_sidebar_plot_01", component_property="figure"),
+        Output("year_slider", "hidden"),
+        Output("year_range_slider", "hidden"),
+        Output("filter_slct_year_acc", "options"),
+        Output("play", "disabled"),
     ],
+    Input("filter_slct_year_range", "value"),
+)
+@metrics.timed
+def toggle_year_range(filter_slct_year_range):
+    range_mode = bool(filter_slct_year_range)
+    # Accumulating does not apply to a year range, nor does the animation (it steps through single years, see
+    # assets/animation.js)
+    acc_options = [{"label": "Accumulate Years", "value": 1, "disabled": range_mode}]
+    return range_mode, not range_mode, acc_options, range_mode
+
+
+## Selection
+# The filters are read once per interaction: update_selection matches them (see plot_functions.Selection, kept in the
+# figure cache by filter state) and stores the query in the "selection" store. The overview and state callbacks
+# take that store as their input and find the same Selection, any worker process can rebuild it from the query.
+@app.callback(
+    Output(component_id="selection", component_property="data"),
     [
         Input(component_id="filter_slct_year", component_property="value"),
         Input(component_id="filter_slct_year_acc", component_property="value"),
         Input(component_id="filter_gender", component_property="value"),
         Input(component_id="filter_race", component_property="value"),
         Input(component_id="filter_methods", component_property="value"),
-
+        Input(component_id="filter_slct_year_range", component_property="value"),
+        Input(component_id="filter_slct_range", component_property="value"),
     ]
 )
+@metrics.timed
+def update_selection(filter_slct_year, filter_slct_year_acc, filter_gender, filter_race, filter_methods,
+                     filter_slct_year_range, filter_slct_range):
+    query = Query.from_inputs(filter_slct_year, filter_slct_year_acc, filter_gender, filter_race, filter_methods,
+                              filter_slct_year_range=filter_slct_year_range, filter_slct_range=filter_slct_range)
+    selection(query)
+    # The callbacks below are triggered by the store on the first call as well, "initial" tells them apart
+    return {"query": query.to_dict(), "initial": dash.ctx.triggered_id is None}
 
 
-def overview_update(filter_slct_year, filter_slct_year_acc, filter_gender, filter_race, filter_methods,):
-    set_globals(filter_slct_year, filter_slct_year_acc)
+def selected_query(selection_data, state=None):
+    return Query.from_dict(selection_data["query"]).with_state(state)
 
-    return overview_map(filter_gender, filter_race, filter_methods), overview_plot01(filter_gender, filter_race, filter_methods,)
+
+## Update Overview
+@app.callback(
+    [
+        Output(component_id="execution_map", component_property="figure"),
+        Output(component_id="overview_sidebar_plot_01", component_property="figure"),
+        Output(component_id="map_drawn", component_property="data"),
+    ],
+    Input(component_id="selection", component_property="data"),
+    State(component_id="map_drawn", component_property="data"),
+)
+@metrics.timed
+def overview_update(selection_data, map_drawn):
+    query = selected_query(selection_data)
+
+    # The full map (with the geometry) is sent until the browser has one, e.g. a change of the filters before the
+    # first map arrived still gets the full map. Later calls only update its data arrays. The flag is sent instead of
+    # the map figure itself, which would be uploaded with every request.
+    if not map_drawn:
+        return overview_map(query), overview_plot01(query), True
+    return overview_map_patch(query), overview_plot01(query), dash.no_update
 
 
 ## Update State view
+# Every output of the state section has its own callback with only the inputs it depends on, e.g. the timeline
+# ignores the accumulate toggle. An interaction only recomputes the outputs that actually depend on the changed input
+# (the plot functions behind them are memoized, see cache.py). The titles only depend on the year inputs and the
+# state, they are built in the browser (assets/titles.js) without a request to the server.
+
+# Inputs of the state section callbacks: the chosen state and the filters (see update_selection)
+STATE_VIEW_INPUTS = [
+    Input(component_id="execution_map", component_property="clickData"),
+    Input(component_id="selection", component_property="data"),
+]
+
+
+def state_name(clickData):
+    if clickData:
+        return clickData["points"][0]['location']
+    return None
+
+
+def state_triggered(selection_data):
+    # Initial call or a click on the map
+    if dash.ctx.triggered_id == "selection":
+        return selection_data["initial"]
+    return dash.ctx.triggered_id in (None, "execution_map")
+
+
 @app.callback(
     [
-        Output(component_id="state_data_plot_01", component_property="figure"),
-        Output(component_id="state_data_plot_02", component_property="figure"),
-        Output(component_id="state_data_plot_03", component_property="figure"),
-        Output(component_id="state_data_list02", component_property="children"),
         Output(component_id="pip_map", component_property="hidden"),
         Output(component_id="state_sidebar", component_property="hidden"),
-        Output(component_id="state_map", component_property="figure"),
+    ],
+    Input(component_id="execution_map", component_property="clickData"),
+)
+@metrics.timed
+def update_state_visibility(clickData):
+    return state_name(clickData) is None, False
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="titles", function_name="state_titles"),
+    [
         Output(component_id="stateRacialDataTitle", component_property="children"),
         Output(component_id="stateMethodDataTitle", component_property="children"),
         Output(component_id="stateTimelineTitle", component_property="children"),
-        Output(component_id="stateListDataTitle", component_property="children"),
-
+        Output(component_id="stateVictimTitle", component_property="children"),
+        Output(component_id="stateCountyTitle", component_property="children"),
     ],
+    [
+        Input(component_id="execution_map", component_property="clickData"),
+        Input(component_id="filter_slct_year", component_property="value"),
+        Input(component_id="filter_slct_year_acc", component_property="value"),
+        Input(component_id="filter_slct_year_range", component_property="value"),
+        Input(component_id="filter_slct_range", component_property="value"),
+    ],
+)
+
+
+@app.callback(
+    Output(component_id="state_data_plot_01", component_property="figure"),
+    STATE_VIEW_INPUTS,
+)
+@metrics.timed
+def update_state_racial(clickData, selection_data):
+    query = selected_query(selection_data, state_name(clickData))
+    return state_plot01(query)
+
+
+@app.callback(
+    Output(component_id="state_data_plot_02", component_property="figure"),
+    STATE_VIEW_INPUTS,
+)
+@metrics.timed
+def update_state_methods(clickData, selection_data):
+    state = state_name(clickData)
+    if state is None:
+        # Nothing to recompute until a state is chosen
+        return choose_state_graph if state_triggered(selection_data) else dash.no_update
+    query = selected_query(selection_data, state)
+    return state_plot02(query)
+
+
+@app.callback(
+    Output(component_id="state_data_plot_04", component_property="figure"),
+    STATE_VIEW_INPUTS,
+)
+@metrics.timed
+def update_state_victims(clickData, selection_data):
+    query = selected_query(selection_data, state_name(clickData))
+    return state_plot04(query)
+
+
+@app.callback(
+    Output(component_id="state_data_counties", component_property="figure"),
+    STATE_VIEW_INPUTS,
+)
+@metrics.timed
+def update_state_counties(clickData, selection_data):
+    state = state_name(clickData)
+    if state is None:
+        # Counties are only drawn for a chosen state
+        return choose_state_graph if state_triggered(selection_data) else dash.no_update
+    query = selected_query(selection_data, state)
+    return state_counties(query)
+
+
+@app.callback(
+    Output(component_id="state_data_plot_03", component_property="figure"),
     [
         Input(component_id="execution_map", component_property="clickData"),
         Input(component_id="filter_gender", component_property="value"),
         Input(component_id="filter_race", component_property="value"),
         Input(component_id="filter_methods", component_property="value"),
         Input(component_id="filter_slct_year", component_property="value"),
-        Input(component_id="filter_slct_year_acc", component_property="value"),
+        Input(component_id="filter_slct_year_range", component_property="value"),
+        Input(component_id="filter_slct_range", component_property="value"),
     ],
-    prevent_initial_call=False,
 )
+@metrics.timed
+def update_state_timeline(clickData, filter_gender, filter_race, filter_methods, filter_slct_year,
+                          filter_slct_year_range, filter_slct_range):
+    # The timeline always starts at 1977 (or the start of the year range), accumulating makes no difference
+    query = Query.from_inputs(filter_slct_year, None, filter_gender, filter_race, filter_methods,
+                              state_name(clickData), filter_slct_year_range, filter_slct_range)
+    return state_plot03(query)
 
 
+@app.callback(
+    [
+        Output(component_id="state_data_list02", component_property="data"),
+        Output(component_id="state_data_list02", component_property="page_count"),
+        Output(component_id="state_data_list02", component_property="page_current"),
+        Output(component_id="state_count", component_property="data"),
+    ],
+    STATE_VIEW_INPUTS + [
+        Input(component_id="state_data_list02", component_property="page_current"),
+        Input(component_id="state_data_list02", component_property="sort_by"),
+    ],
+)
+@metrics.timed
+def update_state_list(clickData, selection_data, page_current, sort_by):
+    query = selected_query(selection_data, state_name(clickData))
+    # A new selection starts at the first page, paging and sorting keep the current one
+    paging = dash.ctx.triggered_id == "state_data_list02"
+    if not paging:
+        page_current = 0
+    sort_by = tuple((col["column_id"], col["direction"]) for col in sort_by or [])
+    rows, page_count = execute_list(query, page_current or 0, LIST_PAGE_SIZE, sort_by)
+
+    # The title is built in the browser from the count (assets/titles.js), paging does not change it
+    if paging:
+        return rows, page_count, page_current, dash.no_update
+    count = {"executions": exec_counter(query), "year": query.year, "accumulate": query.accumulate,
+             "first_year": query.first_year, "state": query.state}
+    return rows, page_count, page_current, count
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="titles", function_name="list_title"),
+    Output(component_id="stateListDataTitle", component_property="children"),
+    Input(component_id="state_count", component_property="data"),
+)
 
-def update_state_view(clickData, filter_gender, filter_race, filter_methods, filter_slct_year, filter_slct_year_acc):
-    h_time = ["Error"]
-    if clickData:
-        set_globals(filter_slct_year, filter_slct_year_acc)
-        clickData_state = clickData["points"][0]['location']
-        map = state_zoom(clickData_state, filter_gender, filter_race, filter_methods)
-
-        # Title Stuff
-        num_exec = exec_counter(filter_gender, filter_race, filter_methods, clickData_state)
-        if filter_slct_year_acc == [1]:
-            h_Racial = f"Racial/Gender Distribution of Executions from 1977 - {filter_slct_year}"
-            h_Method = f"Distribution of Execution Methods from 1977 - {filter_slct_year}"
-            h_list = f"{num_exec} Executions from 1977 - {filter_slct_year}"
-        else:
-            h_Racial = f"Racial/Gender Distribution of Executions in {filter_slct_year}"
-            h_Method = f"Distribution of Execution Methods in {filter_slct_year}"
-            h_list = f"{num_exec} Executions in {filter_slct_year}"
-        h_Racial = h_Racial + " in " + clickData["points"][0]['location']
-        h_Method = h_Method + " in " + clickData["points"][0]['location']
-        h_list = h_list + " in " + clickData["points"][0]['location']
-        h_timeline = f"Executions per Year (1977 - {filter_slct_year}) in " + clickData["points"][0]['location']
-
-        return state_plot01(filter_gender, filter_race, filter_methods, clickData_state), \
-               state_plot02(filter_gender, filter_race, filter_methods, clickData_state), \
-               state_plot03(filter_gender, filter_race, filter_methods, clickData_state), \
-               execute_list(filter_gender, filter_race, filter_methods, clickData_state), False, False, map, h_Racial, h_Method, h_timeline, h_list
-    else:
-        h_none = ""
-        list_null = "Choose a state to view executions"
-
-        # Title Stuff
-        num_exec = exec_counter(filter_gender, filter_race, filter_methods, None)
-        if filter_slct_year_acc == [1]:
-            h_Racial = f"Racial/Gender Distribution of Executions from 1977 - {filter_slct_year}"
-            h_Method = f"Distribution of Execution Methods from 1977 - {filter_slct_year}"
-            h_list = f"{num_exec} Executions from 1977 - {filter_slct_year}"
-        else:
-            h_Racial = f"Racial/Gender Distribution of Executions in {filter_slct_year}"
-            h_Method = f"Distribution of Execution Methods in {filter_slct_year}"
-            h_list = f"{num_exec} Executions in {filter_slct_year}"
-        h_Racial = h_Racial + "  in the United States of America"
-        h_Method = h_Method + "  in the United States of America"
-        h_list = h_list + "  in the United States of America"
-        h_timeline = f"Executions per Year (1977 - {filter_slct_year}) in the United States of America"
-
-        return state_plot01(filter_gender, filter_race, filter_methods, None),\
-               choose_state_graph, \
-               state_plot03(filter_gender, filter_race, filter_methods, None), \
-               execute_list(filter_gender, filter_race, filter_methods, None),\
-               True, False, null_graph, h_Racial, list_null, h_timeline, h_list
 
 @app.callback(
-    [Output(component_id="nationalTitle", component_property="children")],
-    [Input(component_id="execution_map", component_property="clickData"),
-     Input(component_id="filter_slct_year", component_property="value"),
-     Input(component_id="filter_slct_year_acc", component_property="value")]
+    Output(component_id="state_map", component_property="figure"),
+    STATE_VIEW_INPUTS,
 )
-def update_main_title(clickData, filter_slct_year, filter_slct_year_acc):
-    if filter_slct_year_acc == [1]:
-        h_time = f"Executions from 1977 - {filter_slct_year} in the USA"
-    else:
-        h_time = f"Executions in {filter_slct_year} in the USA"
+@metrics.timed
+def update_state_zoom(clickData, selection_data):
+    state = state_name(clickData)
+    if state is None:
+        # The picture-in-picture map is hidden until a state is chosen
+        return null_graph if state_triggered(selection_data) else dash.no_update
+    query = selected_query(selection_data, state)
+    return state_zoom(query)
+
+app.clientside_callback(
+    ClientsideFunction(namespace="titles", function_name="main_title"),
+    Output(component_id="nationalTitle", component_property="children"),
+    [
+        Input(component_id="filter_slct_year", component_property="value"),
+        Input(component_id="filter_slct_year_acc", component_property="value"),
+        Input(component_id="filter_slct_year_range", component_property="value"),
+        Input(component_id="filter_slct_range", component_property="value"),
+    ],
+)
+
+## Cache Statistics
+@app.server.route("/stats/cache")
+def cache_stats():
+    return flask.jsonify(cache.stats())
+
+
+## Aggregate API
+# Counts under the dashboard filters as JSON, for other tools (see api.py)
+@app.server.route("/api/v1/counts")
+def api_counts():
+    try:
+        query, by = api.parse_counts(flask.request.args)
+    except ValueError as e:
+        return flask.jsonify(error=str(e)), 400
+    return api.respond(flask.request, ("counts", query, by), lambda: api.counts(query, by))
+
+
+@app.server.route("/api/v1/dimensions")
+def api_dimensions():
+    return api.respond(flask.request, ("dimensions",), api.dimensions)
+
+
+## Metrics
+# Timing histograms of the plot functions and callbacks in the Prometheus text format (see metrics.py)
+@app.server.before_request
+def start_request_timer():
+    metrics.start_request()
+
+
+@app.server.after_request
+def record_callback_request(response):
+    if flask.request.path == "/_dash-update-component":
+        output = (flask.request.get_json(silent=True) or {}).get("output", "")
+        callback = app.callback_map.get(output, {}).get("callback")
+        metrics.end_request(getattr(callback, "__name__", output), response)
+    return response
+
+
+@app.server.route("/metrics")
+def metrics_export():
+    return flask.Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+## Geometry and Compression
+# State and county outlines referenced by the maps (see geo.states_url, geo.load_counties). The URLs carry a content
+# hash, so they can be cached for a year.
+@app.server.route("/geodata/<path:name>.json")
+def geodata(name):
+    path = os.path.abspath(os.path.join(GEO_DIR, f"{name}.json"))
+    if os.path.commonpath([GEO_DIR, path]) != GEO_DIR or not os.path.isfile(path):
+        flask.abort(404)
+    with open(path, "rb") as f:
+        response = flask.Response(f.read(), mimetype="application/json")
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    return response
+
+
+# JSON responses are compressed (registered after the metrics hook, which then records the compressed size).
+# The figures are encoded by plotly.io.json, which uses orjson when it is installed.
+@app.server.after_request
+def compress_response(response):
+    return compression.compress_response(flask.request, response)
+
+
+## Ingestion
+# New rows appended to the CSV show up without a restart (every worker process watches the file itself)
+ingest.watch()
+
+# New records as a JSON list of objects with the CSV columns. Only enabled when INGEST_TOKEN is set, requests have
+# to send it as "Authorization: Bearer <token>".
+@app.server.route("/ingest", methods=["POST"])
+def ingest_records():
+    token = os.environ.get("INGEST_TOKEN")
+    if not token:
+        return flask.jsonify(error="Ingestion is disabled"), 403
+    if flask.request.headers.get("Authorization") != f"Bearer {token}":
+        return flask.jsonify(error="Invalid token"), 401
+    records = flask.request.get_json(silent=True)
+    if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+        return flask.jsonify(error="Expected a JSON list of records"), 400
+    try:
+        added = ingest.add_records(records)
+    except (ValueError, TypeError) as e:
+        return flask.jsonify(error=str(e)), 400
+    except RuntimeError as e:
+        # The CSV changed in a way that needs a restart (see ingest.read_appended)
+        return flask.jsonify(error=str(e)), 409
+    return flask.jsonify(added=added, rows=len(cfg.Data))
 
-    return [h_time]
 
 ## Start Server
 if __name__ == '__main__':
-    app.run_server(debug=False)
+    # No module globals are shared between callbacks, so requests can be served in parallel
+    app.run(debug=False, threaded=True)
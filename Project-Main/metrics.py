@@ -0,0 +1,110 @@
+## Metrics
+# Wall time of the plot functions and callbacks, exposed in the Prometheus text format on /metrics (see main.py).
+#   dashboard_function_seconds{function}        every call of a @timed function (cache hits included)
+#   dashboard_phase_seconds{function,phase}     filter / aggregate / figure / serialize parts of a call
+#   dashboard_callback_seconds{callback}        a whole callback request, from the request to the response
+#   dashboard_response_bytes{callback}          size of the callback response sent to the browser
+# Histogram _count series are the call counts. The serialize phase of a callback is the part of its request
+# outside the callback function itself (building and encoding the JSON response).
+
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import flask
+
+# Upper bounds of the histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (not cumulative) + overflow, sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        i = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self.lock:
+            counts, total = self.series.get(labelvalues, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[i] += 1
+            self.series[labelvalues] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = sorted((labelvalues, list(counts), total) for labelvalues, (counts, total) in self.series.items())
+        for labelvalues, counts, total in series:
+            labels = ",".join(f'{name}="{value}"' for name, value in zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines)
+
+
+function_seconds = Histogram("dashboard_function_seconds", "Wall time of a plot function or callback call.",
+                             ["function"])
+phase_seconds = Histogram("dashboard_phase_seconds", "Wall time of a phase of a plot function or callback call.",
+                          ["function", "phase"])
+callback_seconds = Histogram("dashboard_callback_seconds", "Wall time of a callback request, serialization included.",
+                             ["callback"])
+response_bytes = Histogram("dashboard_response_bytes", "Size of a callback response body in bytes.",
+                           ["callback"], BYTES_BUCKETS)
+
+HISTOGRAMS = [function_seconds, phase_seconds, callback_seconds, response_bytes]
+
+# Name of the @timed function running in this thread, phases are recorded under it
+current = threading.local()
+
+
+def timed(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        outer = getattr(current, "function", None)
+        current.function = function.__name__
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            current.function = outer
+            function_seconds.observe(elapsed, function.__name__)
+            # The outermost call in a request is the callback, the rest of the request is serialization
+            if outer is None and flask.has_request_context():
+                flask.g.callback_time = getattr(flask.g, "callback_time", 0.0) + elapsed
+    return wrapper
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phase_seconds.observe(time.perf_counter() - start, getattr(current, "function", None) or "", name)
+
+
+def start_request():
+    flask.g.request_start = time.perf_counter()
+    flask.g.callback_time = 0.0
+
+
+def end_request(callback, response):
+    # Record a finished callback request (call from an after_request hook)
+    elapsed = time.perf_counter() - flask.g.request_start
+    callback_seconds.observe(elapsed, callback)
+    phase_seconds.observe(max(elapsed - flask.g.callback_time, 0.0), callback, "serialize")
+    response_bytes.observe(response.calculate_content_length() or 0, callback)
+
+
+def render():
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
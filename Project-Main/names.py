@@ -0,0 +1,37 @@
+## Name Store
+# First and last names of the executed, kept apart from Data: only the execution list shows them (see execute_list).
+# The columns stay categorical (memory-mapped codes from the snapshot plus one copy of every distinct name), the full
+# names and their sort order are only built when the list asks for them.
+
+import numpy as np
+import pandas as pd
+
+NAME_COLUMNS = ["First Name", "Last Name"]
+
+
+class NameStore:
+    def __init__(self, names):
+        # names: frame with the NAME_COLUMNS as categoricals, one row per row of Data
+        self.names = names
+        # Dense rank of the full name of every row, built on first use
+        self.ranks = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def full_names(self, rows):
+        # "First Last" of the rows at the positions rows
+        df = self.names.iloc[rows]
+        return (df["First Name"].astype(object) + " " + df["Last Name"].astype(object)).tolist()
+
+    def rank(self):
+        if self.ranks is None:
+            first = self.names["First Name"].array
+            last = self.names["Last Name"].array
+            # Rank the distinct (first, last) pairs only, then spread the ranks over the rows
+            width = len(last.categories) + 1
+            pairs, inverse = np.unique(first.codes.astype(np.int64) * width + last.codes + 1, return_inverse=True)
+            full = (pd.Series(pd.Categorical.from_codes(pairs // width, first.categories)).astype(object) + " " +
+                    pd.Series(pd.Categorical.from_codes(pairs % width - 1, last.categories)).astype(object))
+            self.ranks = full.rank(method="dense").to_numpy(dtype=np.int64)[inverse]
+        return self.ranks
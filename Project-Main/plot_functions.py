@@ -5,8 +5,14 @@ import plotly.express as px
 import numpy as np
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
+from dash import Patch
 
-from cfg import Data, states_geojson, Data_dummy, null_graph, choose_state_graph
+from cfg import Data, names, cube, victim_cube, states_geojson_map_url, states_pip_shapes, Data_dummy, null_graph, choose_state_graph
+from aggregates import YEAR, STATE, SEX, RACE, METHOD, VICTIM_SEXES, VICTIM_RACES, CountyIndex
+from cache import cache
+from figstore import stored
+from metrics import timed, phase
+from geo import load_counties
 
 method_color_discrete_map = {'Firing Squad': '#1b9e77', 'Electrocution': '#7570b3', 'Gas': '#e7298a',
                              'Lethal Injection': '#66a61e', 'Hanging': '#e6ab02'}
@@ -88,112 +94,188 @@ table_style01 = dict(
 
 
 ## Aux Functions
-def set_globals(set_year_var, accumulating_var):
-    global accumulating
-    if accumulating_var == [1]:
-        accumulating = True
-    else:
-        accumulating = False
-    global set_year
-    set_year = set_year_var
+# Every function below gets the user's selection as a Query (see query.py), nothing is kept in globals.
+# The plot functions are memoized on that Query (see cache.py), so repeated selections skip pandas and Plotly.
+# Figures of the default filters are also read from the figure store when it was warmed up (see figstore.py).
+
+def figure_json(fig):
+    # Plotly JSON of a figure (numeric arrays as base64 typed arrays). The plot functions cache this instead of the
+    # Figure, so it is built once and not on every response.
+    with phase("serialize"):
+        fig = fig.to_plotly_json()
+        # Text arrays (locations, labels, customdata) are left as object arrays, lists encode faster
+        for trace in fig["data"]:
+            for key, value in trace.items():
+                if isinstance(value, np.ndarray):
+                    trace[key] = value.tolist()
+        return fig
+
+
+def attach_geometry(fig, geojson_url):
+    # The maps are built without geometry and get the URL of the shared outlines instead (served by main.py).
+    # The browser downloads them once, responses and cached map figures stay small.
+    fig = figure_json(fig)
+    fig["data"][0]["geojson"] = geojson_url
+    return fig
+
+
+def cube_filter(query, with_past=False):
+    # Index of the cube cells that match the years (taking into account if accu or a year range), the state and the
+    # user filters. with_past starts single years at the first year of the data as well (for the timeline).
+    with phase("filter"):
+        return selection(query).index(query.state, with_past)
+
+
+def year_range(query, with_past=False):
+    # First and last year of the selected period
+    first_year = query.first_year
+    if first_year is None:
+        if query.accumulate is True or with_past is True:
+            first_year = cube.years[0]
+        else:
+            first_year = query.year
+    return first_year, query.year
 
 
-def filter_out(filter_out_list):
-    df = Data.drop(columns=filter_out_list)
-    # Remove years (taking into account if accu)
-    if accumulating is True:
-        df = df[df["Execution Year"] <= set_year]
+def row_mask(query, rows):
+    # Which of the rows (positions in Data) match the years and the user filters, the same cells as cube_index.
+    # Compares the category codes of the rows, no frame is built.
+    first_year, last_year = year_range(query)
+    years = Data["Execution Year"].to_numpy()[rows]
+    mask = (years >= first_year) & (years <= last_year)
+    for col, values in (("Sex", query.gender), ("Race", query.race), ("Execution Method", query.methods)):
+        mask &= np.isin(Data[col].array.codes[rows], cube.label_index(col, values))
+    return mask
+
+
+def cube_index(query, with_past):
+    years = cube.year_index(*year_range(query, with_past))
+    if query.state is not None:
+        states = cube.label_index("State", [query.state])
     else:
-        df = df[df["Execution Year"] == set_year]
-    return df
+        states = np.arange(len(cube.labels["State"]))
+    return (years,
+            states,
+            cube.label_index("Sex", query.gender),
+            cube.label_index("Race", query.race),
+            cube.label_index("Execution Method", query.methods))
+
+
+class Selection:
+    # What the filters of a query select, for every state: the cube cells and the matching rows of Data.
+    # One Selection per filter state is shared by all plot functions (see selection), so an interaction matches the
+    # filters once, whatever number of charts and states read them.
+    def __init__(self, query):
+        self.query = query.with_state(None)
+        # Cube index of all states, the state axis is narrowed per call
+        self.cells = cube_index(self.query, False)
+
+    def index(self, state=None, with_past=False):
+        years = cube.year_index(*year_range(self.query, with_past)) if with_past else self.cells[YEAR]
+        states = self.cells[STATE] if state is None else cube.label_index("State", [state])
+        return (years, states) + self.cells[SEX:]
 
+    def matches(self, rows):
+        # Which of the rows (positions in Data) are selected, only those rows are read
+        return row_mask(self.query, rows)
 
-def filter_out_w_past(filter_out_list):
-    df = Data.copy()
-    # Remove rows that match the filters and years
-    df = df.drop(filter_out_list, axis=1)
-    df = df[df["Execution Year"] <= set_year]
-    return df
+    def rows(self, state=None):
+        # Positions in Data of the selected rows (of a state), in Data order
+        if state is None:
+            return np.flatnonzero(np.unpackbits(selection_bitmap(self.query), count=len(Data)))
+        rows = np.sort(counties().rows(state))
+        return rows[self.matches(rows)]
 
-def user_filters(df, filter_gender, filter_race, filter_methods):
-    mask = df['Sex'].isin(filter_gender) & \
-           df['Race'].isin(filter_race) & \
-           df['Execution Method'].isin(filter_methods)
-    return df[mask]
 
+@cache.memoize()
+def selection(query):
+    # Selection of the filters of query (its state does not matter), kept in the figure cache by filter state
+    if query.state is not None:
+        return selection(query.with_state(None))
+    return Selection(query)
 
 
+@cache.memoize()
+def selection_bitmap(query):
+    # Selected rows of all of Data as a packed bitmap (one bit per row), for the national list. A cache entry of its
+    # own, so its size counts against the byte bound of the cache; state views only read their own rows.
+    return np.packbits(row_mask(query, slice(None)))
 
 
-def overview_map(filter_gender, filter_race, filter_methods):
-    print("Running.. overview_map")
 
-    # Create new dataframe
-    filter_out_list = ["Execution#", "First Name", "Last Name", "Middle Name(s)", "Suffix", "Foreign National",
-                       "Execution Volunteer", "Number of Victims", "Number of White Male Victims",
-                       "Number of Black Male Victims", "Number of Latino Male Victims", "Number of Asian Male Victims",
-                       "Number of Native American Male Victims", "Number of Other Race Male Victims",
-                       "Number of White Female Victims", "Number of Black Female Victims",
-                       "Number of Latino Female Victims", "Number of Asian Female Victims",
-                       "Number of Native American Female Victims", "Number of Other Race Female Victims"]
-    df = filter_out(filter_out_list)
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
 
-    # Count executions and put into new col.
-    df = df.groupby("State").size().reset_index(name="Executions")
-    # Remove states with no executions.
-    df = df[df["Executions"] != 0]
-    # Log() execution kills
-    df["log_Executions"] = np.log(df["Executions"] + 1)  # Add 1 to avoid log(0) errors.
+
+@timed
+@cache.memoize()
+@stored()
+def overview_map(query):
+    index = cube_filter(query)
+    with phase("aggregate"):
+        # Count executions per state (states with no executions are left out)
+        df = cube.frame(index, by=[STATE])
+        # Log() execution kills
+        df["log_Executions"] = np.log(df["Executions"] + 1)  # Add 1 to avoid log(0) errors.
 
     # Create new Map
     # https://plotly.com/python/reference/choropleth/
-    fig = px.choropleth(
-        data_frame=df,
-        geojson=states_geojson,
-        color="log_Executions",
-        locations="State",
-        scope="usa",
-        featureidkey="properties.name",
-        color_continuous_scale=px.colors.sequential.Redor,
-        center={"lat": 38.856820, "lon": -101.636240},
-        hover_name="State",
-        hover_data={'Executions': True, 'State': False, 'log_Executions': False, }
-
-    )
-    fig.update(layout_coloraxis_showscale=False)
-    # Hover Design
-    fig.update_layout(map_style01)
-    # Map Design
-    fig.update_layout(
-        margin_autoexpand=True,
-        margin=dict(l=0, r=0, t=0, b=0),
-        clickmode='event',
-    )
+    with phase("figure"):
+        fig = px.choropleth(
+            data_frame=df,
+            color="log_Executions",
+            locations="State",
+            scope="usa",
+            featureidkey="properties.name",
+            color_continuous_scale=px.colors.sequential.Redor,
+            center={"lat": 38.856820, "lon": -101.636240},
+            hover_name="State",
+            hover_data={'Executions': True, 'State': False, 'log_Executions': False, }
 
-    return fig
+        )
+        fig.update(layout_coloraxis_showscale=False)
+        # Hover Design
+        fig.update_layout(map_style01)
+        # Map Design
+        fig.update_layout(
+            margin_autoexpand=True,
+            margin=dict(l=0, r=0, t=0, b=0),
+            clickmode='event',
+        )
 
+    return attach_geometry(fig, states_geojson_map_url)
 
-def overview_plot01(filter_gender, filter_race, filter_methods):
-    #   Figure 01 - Line Chart when Accu, Plot bar when not.
-    print("Running.. overview_plot01")
 
-    # Create new dataframe
-    filter_out_list = ["Execution#", "First Name", "Last Name", "Middle Name(s)", "Suffix", "Foreign National",
-                       "Execution Volunteer", "Number of Victims", "Number of White Male Victims",
-                       "Number of Black Male Victims", "Number of Latino Male Victims", "Number of Asian Male Victims",
-                       "Number of Native American Male Victims", "Number of Other Race Male Victims",
-                       "Number of White Female Victims", "Number of Black Female Victims",
-                       "Number of Latino Female Victims", "Number of Asian Female Victims",
-                       "Number of Native American Female Victims", "Number of Other Race Female Victims"]
-    df = filter_out(filter_out_list)
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
+@timed
+def overview_map_patch(query):
+    # Partial update for a map the browser already shows: only the per-state arrays change,
+    # the geometry and layout were sent with the first full figure.
+    trace = overview_map(query)["data"][0]
+    patch = Patch()
+    for key in ("locations", "z", "customdata", "hovertext"):
+        patch["data"][0][key] = trace[key]
+    return patch
+
 
-    df = df.groupby(["Execution Method", "Execution Year"])["Execution Method"].count().reset_index(name='Executions')
+@timed
+@cache.memoize()
+@stored()
+def overview_plot01(query):
+    #   Figure 01 - Line Chart when Accu, Plot bar when not.
+    index = cube_filter(query)
+    with phase("aggregate"):
+        # Count executions per method and year
+        df = cube.frame(index, by=[YEAR, METHOD])
+        df = df.sort_values(["Execution Method", "Execution Year"])
 
     if df.empty:
         return null_graph
 
+    with phase("figure"):
+        fig = overview_line_chart(df)
+
+    return figure_json(fig)
+
+
+def overview_line_chart(df):
     fig = px.line(data_frame=df, x="Execution Year", y="Executions", color="Execution Method",
                   color_discrete_map=method_color_discrete_map, markers=True)
     fig.update_layout(height=320, margin=dict(l=40, r=10, t=0, b=0), legend=dict(yanchor="top", y=0.95, xanchor="left", x=0.05))
@@ -204,6 +286,35 @@ def overview_plot01(filter_gender, filter_race, filter_methods):
     return fig
 
 
+@timed
+@cache.memoize()
+@stored()
+def animation_frames(query):
+    # Per-year counts of every state and method for the user filters (all years, whatever year is selected).
+    # The browser steps through these when the year animation plays (see assets/animation.js),
+    # so playing does not cost a server round trip per frame.
+    index = (np.arange(len(cube.years)),) + cube_filter(query.with_state(None))[1:]
+    with phase("aggregate"):
+        state_counts = cube.totals(index, by=[YEAR, STATE])
+        method_counts = cube.totals(index, by=[YEAR, METHOD])
+    with phase("figure"):
+        empty_line = pd.DataFrame({"Execution Year": [], "Executions": [], "Execution Method": []})
+        line_layout = overview_line_chart(empty_line).to_plotly_json()["layout"]
+
+    with phase("serialize"):
+        return {
+            "accumulate": query.accumulate,
+            "years": cube.years.tolist(),
+            "states": cube.labels["State"].tolist(),
+            "state_counts": state_counts.tolist(),
+            "methods": cube.labels["Execution Method"][index[METHOD]].tolist(),
+            "method_counts": method_counts.tolist(),
+            "method_colors": method_color_discrete_map,
+            # Layout used when the line chart currently shows the "no data" graph
+            "line_layout": line_layout,
+        }
+
+
 
 ######################################
 #
@@ -211,46 +322,44 @@ def overview_plot01(filter_gender, filter_race, filter_methods):
 #
 ######################################
 
-def state_zoom(state_name, filter_gender, filter_race, filter_methods,):
-    print("Running.. state_zoom")
-
-    # Create new dataframe
-    filter_out_list = ["Execution#", "First Name", "Last Name", "Middle Name(s)", "Suffix", "Foreign National",
-                       "Execution Volunteer", "Number of Victims", "Number of White Male Victims",
-                       "Number of Black Male Victims", "Number of Latino Male Victims", "Number of Asian Male Victims",
-                       "Number of Native American Male Victims", "Number of Other Race Male Victims",
-                       "Number of White Female Victims", "Number of Black Female Victims",
-                       "Number of Latino Female Victims", "Number of Asian Female Victims",
-                       "Number of Native American Female Victims", "Number of Other Race Female Victims"]
-    df = filter_out(filter_out_list)
-    #Run filters
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
-    # Count executions and put into new col.
-    df = df["State"].value_counts().rename_axis('State').reset_index(name='Executions')
-    # Remove states with no executions.
-    df = df[df["Executions"] != 0]
-    # Log execution kills
-    df["log_Executions"] = np.log(df["Executions"])
-
-    # Removing all state names to normalize colors on heatmap
-    # Get index of selected state
-    df_temp01 = df.loc[df.loc[df.State == state_name, 'State'].index.values]
-    if df_temp01.empty:
-        df_temp01 = pd.DataFrame([[state_name, 0, 0]], columns=["State", "Executions", "log_Executions"])
-        df = df_temp01
+@timed
+@cache.memoize()
+@stored()
+def state_zoom(query):
+    # The chosen state on its own, colored like on the overview map. Only its outline is sent, with fixed bounds.
+    shape = states_pip_shapes.get(query.state)
+    if shape is None:
+        return null_graph
+    geojson, (lon_range, lat_range) = shape
+
+    index = cube_filter(query.with_state(None))
+    with phase("aggregate"):
+        # Count executions per state (states with no executions are left out)
+        df = cube.frame(index, by=[STATE])
+        # Log execution kills
+        df["log_Executions"] = np.log(df["Executions"])
+
+    with phase("figure"):
+        df_state = df[df.State == query.state]
+        if df_state.empty:
+            df_state = pd.DataFrame([[query.state, 0, 0]], columns=["State", "Executions", "log_Executions"])
+            color_scale, range_color = px.colors.sequential.Greys, None
+        else:
+            # The colors are scaled to all states, as on the overview map
+            color_scale = px.colors.sequential.Redor
+            range_color = (df["log_Executions"].min(), df["log_Executions"].max())
         # Create new Map
         # https://plotly.github.io/plotly.py-docs/generated/plotly.express.choropleth.html
         fig = px.choropleth(
-            data_frame=df,
-            geojson=states_geojson,
+            data_frame=df_state,
+            geojson=geojson,
             color="log_Executions",
             locations="State",
-            scope="usa",
             featureidkey="properties.name",
-            color_continuous_scale=px.colors.sequential.Greys,
+            color_continuous_scale=color_scale,
+            range_color=range_color,
             hover_name="State",
             hover_data={'Executions': False, 'State': False, 'log_Executions': False},
-
         )
         fig.update(layout_coloraxis_showscale=False)
         # Hover Design
@@ -260,236 +369,268 @@ def state_zoom(state_name, filter_gender, filter_race, filter_methods,):
             margin_autoexpand=True,
             margin=dict(l=0, r=0, t=0, b=0),
         )
-        fig.update_geos(fitbounds="locations")
-    else:
-        i = df[(df.State == state_name)].index
-        # Remove from main df
-        df.drop(i)
-        # Set all other states to None.
-        df = df.assign(State=None)
-        # Add state back, now as the only name.
-        df = df.append(df_temp01)
-        # Create new Map
-        # https://plotly.github.io/plotly.py-docs/generated/plotly.express.choropleth.html
+        # Fixed bounds of the state instead of fitbounds, plotly.js does not have to measure the outline
+        fig.update_geos(visible=False, projection_type="mercator", lonaxis_range=lon_range, lataxis_range=lat_range)
+
+    return figure_json(fig)
+
+
+# Rows of Data by state and county, built on first drill-down (the national view does not need it)
+county_index = None
+
+
+def counties():
+    global county_index
+    if county_index is None:
+        county_index = CountyIndex.from_frame(Data)
+    return county_index
+
+
+@timed
+@cache.memoize()
+@stored()
+def state_counties(query):
+    # Executions per county of the selected state, on the county outlines of that state (see geo.load_counties)
+    geometry = load_counties(query.state)
+    if geometry is None:
+        return null_graph
+    geojson_url, county_names = geometry
+
+    with phase("filter"):
+        index = counties()
+        rows = index.rows(query.state)
+        rows = rows[selection(query).matches(rows)]
+    with phase("aggregate"):
+        codes = Data["County"].array.codes[rows]
+        # Rows of the state without a county are not on the map
+        counts = np.bincount(codes[codes >= 0], minlength=len(index.counties))
+        # Every county of the state is drawn, those without executions as 0
+        positions = index.counties.get_indexer(county_names)
+        df = pd.DataFrame({"County": county_names, "Executions": np.where(positions >= 0, counts[positions], 0)})
+        df["log_Executions"] = np.log(df["Executions"] + 1)
+
+    with phase("figure"):
         fig = px.choropleth(
             data_frame=df,
-            geojson=states_geojson,
             color="log_Executions",
-            locations="State",
-            scope="usa",
+            locations="County",
             featureidkey="properties.name",
             color_continuous_scale=px.colors.sequential.Redor,
-            center={"lat": 38.856820, "lon": -101.636240},
-            hover_name="State",
-            hover_data={'Executions': False, 'State': False, 'log_Executions': False}
-
+            hover_name="County",
+            hover_data={'Executions': True, 'County': False, 'log_Executions': False},
         )
         fig.update(layout_coloraxis_showscale=False)
-        # Hover Design
         fig.update_layout(map_style01)
-        # Map Design
-        fig.update_layout(
-            margin=dict(l=0, r=0, t=0, b=0),
-        )
-        fig.update_geos(fitbounds="locations")
+        fig.update_layout(height=320, margin=dict(l=0, r=0, t=0, b=0))
+        fig.update_geos(fitbounds="geojson", visible=False, projection_type="mercator")
 
-    return fig
+    return attach_geometry(fig, geojson_url)
 
 
-def exec_counter(filter_gender, filter_race, filter_methods, state_name):
-    print("Running.. exec_counter")
-
-    # Create new dataframe
-    filter_out_list = ["Execution#", "First Name", "Last Name", "Middle Name(s)", "Suffix", "Foreign National",
-                       "Execution Volunteer", "Number of Victims", "Number of White Male Victims",
-                       "Number of Black Male Victims", "Number of Latino Male Victims", "Number of Asian Male Victims",
-                       "Number of Native American Male Victims", "Number of Other Race Male Victims",
-                       "Number of White Female Victims", "Number of Black Female Victims",
-                       "Number of Latino Female Victims", "Number of Asian Female Victims",
-                       "Number of Native American Female Victims", "Number of Other Race Female Victims"]
-    df = filter_out(filter_out_list)
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
-    if state_name != None:
-        df = df[df['State'] == state_name]
-    # Remove Methods with no executions.
-    df = df[df["Sex"] != 0]
-    amount = int(len(df.index))
+@timed
+def exec_counter(query):
+    index = cube_filter(query)
+    with phase("aggregate"):
+        amount = int(cube.totals(index))
 
     return amount
 
 
-def execute_list(filter_gender, filter_race, filter_methods, state_name):
-    print("Running.. execute_list")
-
-    # Create new dataframe
-    filter_out_list = []
-    df = filter_out(filter_out_list)
-    if state_name != None:
-        df = df[df['State'] == state_name]
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
-    # Create new columns
-    df["Name"] = df["First Name"] + " " + df["Last Name"]
-    # col_list for table (Data that is shown)
-    # Data["Execution Method"] = Data["Execution Method"].astype("str")
-    col_header = ("Execution Year", "Execution Method", "Name", "Sex", "Race", "Number of Victims",)
-    # Rearrange
-    df = df[["Execution Year", "Execution Method", "Name", "Sex", "Race", "Number of Victims"]]
-    # https://plotly.com/python/table/
-    for cols in df:
-        if cols not in col_header:
-            df = df.drop(cols, axis=1)
-
-    table = dbc.Table.from_dataframe(df=df,
-                                     striped=True,
-                                     bordered=True,
-                                     hover=True
-                                     )
-
-    return table
-
-
-#@cache.memoize()
-def state_plot01(filter_gender, filter_race, filter_methods, state_name):
-    print("Running.. state_plot01")
-    # Filter out unnecessary columns
-    filter_out_list = ["Execution#", "First Name", "Last Name", "Middle Name(s)", "Suffix", "Foreign National",
-                       "Execution Volunteer", "Number of Victims", "Number of White Male Victims",
-                       "Number of Black Male Victims", "Number of Latino Male Victims", "Number of Asian Male Victims",
-                       "Number of Native American Male Victims", "Number of Other Race Male Victims",
-                       "Number of White Female Victims", "Number of Black Female Victims",
-                       "Number of Latino Female Victims", "Number of Asian Female Victims",
-                       "Number of Native American Female Victims", "Number of Other Race Female Victims"]
-    df = filter_out(filter_out_list)
-
-    # Filter by state
-    if state_name is not None:
-        df = df.loc[df['State'] == state_name]
-
-    # Filter by user filters
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
-
-    # Count the number of executions by race and sex
-    df = df[["Race", "Sex"]].value_counts().rename_axis(["Race", "Sex"]).reset_index(name='Executions')
-
-    # Remove rows where Sex = 0
-    df = df[df["Sex"] != 0]
-
-    # Use vectorized string operations to capitalize the first letter of each word in the Race column
-    df["Race"] = df["Race"].str.title()
-
-    # Create the plot
-    fig = px.bar(
-        data_frame=df,
-        x="Race",
-        y="Executions",
-        color="Sex",
-        color_discrete_map=gender_color_discrete_map,
-    )
-    fig.update_layout(graph_style01)
-    fig.update_xaxes(xaxis_style01)
-    fig.update_yaxes(yaxis_style01)
-    fig.update_layout(height=273, margin=dict(l=40, r=10, t=0, b=0))
-    fig.update_layout(legend=dict(yanchor="bottom",
-                                  y=0.7,
-                                  xanchor="right",
-                                  x=1,
-                                  title="",
-                                  bgcolor=legend_bg),
-                      legend_font=dict(color=legend_font_color))
-    fig.update_xaxes(title="")
+# Columns of the execution list, in order
+LIST_COLUMNS = ["Execution Year", "Execution Method", "Name", "Sex", "Race", "Number of Victims"]
+LIST_PAGE_SIZE = 20
+
+# Rank of every row of Data per list column, built on first use.
+# Sorting a selection is then a lexsort of small integer arrays, whatever the column type.
+list_ranks = {}
+
+
+def list_rank(column):
+    if column not in list_ranks or len(list_ranks[column]) != len(Data):
+        if column == "Name":
+            list_ranks[column] = names.rank()
+        else:
+            values = Data[column].astype(str) if Data[column].dtype.name == "category" else Data[column]
+            list_ranks[column] = values.rank(method="dense").to_numpy(dtype=np.int64)
+    return list_ranks[column]
+
+
+def set_data(data, data_names, data_cube, data_victim_cube):
+    # Swap in new data (see ingest.py), before the data version changes. Cached results are keyed by data version
+    # (see cache.py), the old ones are only dropped to free their memory.
+    global Data, names, cube, victim_cube, county_index
+    Data, names, cube, victim_cube = data, data_names, data_cube, data_victim_cube
+    list_ranks.clear()
+    county_index = None
+    cache.clear()
+
+
+def execute_list_rows(query):
+    # Positions in Data of the executions in the list (Data order)
+    with phase("filter"):
+        return selection(query).rows(query.state)
+
+
+@cache.memoize()
+def execute_list_order(query, sort_by):
+    # Positions of the list rows in display order. sort_by is a tuple of (column, "asc"/"desc") pairs.
+    # Kept as int32 (half the size in the cache, see cache.py), Data has far fewer than 2 ** 31 rows.
+    rows = execute_list_rows(query).astype(np.int32, copy=False)
+    if not sort_by:
+        return rows
+    with phase("aggregate"):
+        # np.lexsort sorts by the last key first
+        keys = [list_rank(column)[rows] * (-1 if direction == "desc" else 1) for column, direction in reversed(sort_by)]
+        return rows[np.lexsort(keys)]
+
+
+@timed
+@stored()
+def execute_list(query, page_current=0, page_size=LIST_PAGE_SIZE, sort_by=()):
+    # One page of the execution list and the number of pages, sorting and paging are done here on the server
+    order = execute_list_order(query, tuple(sort_by))
+    rows = order[page_current * page_size:(page_current + 1) * page_size]
+
+    with phase("serialize"):
+        df = Data.iloc[rows]
+        # Create new columns
+        df = df.assign(Name=names.full_names(rows))
+        records = df[LIST_COLUMNS].to_dict("records")
+    page_count = max(1, -(-len(order) // page_size))
+
+    return records, page_count
+
+
+@timed
+@cache.memoize()
+@stored()
+def state_plot01(query):
+    index = cube_filter(query)
+    with phase("aggregate"):
+        # Count the number of executions by race and sex
+        df = cube.frame(index, by=[SEX, RACE])
+
+        # Use vectorized string operations to capitalize the first letter of each word in the Race column
+        df["Race"] = df["Race"].str.title()
+
+    with phase("figure"):
+        # Create the plot
+        fig = px.bar(
+            data_frame=df,
+            x="Race",
+            y="Executions",
+            color="Sex",
+            color_discrete_map=gender_color_discrete_map,
+        )
+        fig.update_layout(graph_style01)
+        fig.update_xaxes(xaxis_style01)
+        fig.update_yaxes(yaxis_style01)
+        fig.update_layout(height=273, margin=dict(l=40, r=10, t=0, b=0))
+        fig.update_layout(legend=dict(yanchor="bottom",
+                                      y=0.7,
+                                      xanchor="right",
+                                      x=1,
+                                      title="",
+                                      bgcolor=legend_bg),
+                          legend_font=dict(color=legend_font_color))
+        fig.update_xaxes(title="")
 
     if df.empty:
         return null_graph
 
-    return fig
+    return figure_json(fig)
 
 
-def state_plot02(filter_gender, filter_race, filter_methods, state_name):
+@timed
+@cache.memoize()
+@stored()
+def state_plot02(query):
     #   Figure 01 - Line Chart when Accu, Plot bar when not.
-    print("Running.. state_plot02")
-
-    # Create new dataframe
-    filter_out_list = ["Execution#", "First Name", "Last Name", "Middle Name(s)", "Suffix", "Foreign National",
-                       "Execution Volunteer", "Number of Victims", "Number of White Male Victims",
-                       "Number of Black Male Victims", "Number of Latino Male Victims", "Number of Asian Male Victims",
-                       "Number of Native American Male Victims", "Number of Other Race Male Victims",
-                       "Number of White Female Victims", "Number of Black Female Victims",
-                       "Number of Latino Female Victims", "Number of Asian Female Victims",
-                       "Number of Native American Female Victims", "Number of Other Race Female Victims"]
-    df = filter_out(filter_out_list)
-    df = df[df['State'] == state_name]
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
-    df = df[["Execution Method"]].value_counts().rename_axis(["Execution Method"]).reset_index(
-        name='Executions')
-    # Remove Methods with no executions.
-    df = df[df["Executions"] != 0]
-    # Create Pie Chart
-    # https://plotly.com/python-api-reference/generated/plotly.express.line
-    fig = px.pie(
-        data_frame=df,
-        names="Execution Method",
-        values="Executions",
-        color="Execution Method",
-        color_discrete_map=method_color_discrete_map,
-    )
-    fig.update_layout(graph_style01)
-    fig.update_xaxes(xaxis_style01)
-    fig.update_yaxes(yaxis_style01)
-    fig.update_layout(height=230, margin=dict(l=10, r=10, t=0, b=50),
-                        legend_font=dict(color=legend_font_color),
-                        legend=dict(bgcolor=legend_bg, yanchor="bottom", y=1, xanchor="center", x=1))
+    index = cube_filter(query)
+    with phase("aggregate"):
+        # Count executions per method (methods with no executions are left out)
+        df = cube.frame(index, by=[METHOD])
+    with phase("figure"):
+        # Create Pie Chart
+        # https://plotly.com/python-api-reference/generated/plotly.express.line
+        fig = px.pie(
+            data_frame=df,
+            names="Execution Method",
+            values="Executions",
+            color="Execution Method",
+            color_discrete_map=method_color_discrete_map,
+        )
+        fig.update_layout(graph_style01)
+        fig.update_xaxes(xaxis_style01)
+        fig.update_yaxes(yaxis_style01)
+        fig.update_layout(height=230, margin=dict(l=10, r=10, t=0, b=50),
+                            legend_font=dict(color=legend_font_color),
+                            legend=dict(bgcolor=legend_bg, yanchor="bottom", y=1, xanchor="center", x=1))
 
     if df.empty:
         return null_graph
-    return fig
-
-def state_plot03(filter_gender, filter_race, filter_methods, state_name):
-    print("Running.. state_plot03")
-
-    # Create new dataframe
-    filter_out_list = ["Execution#", "First Name", "Last Name", "Middle Name(s)", "Suffix", "Foreign National",
-                       "Execution Volunteer", "Number of Victims", "Number of White Male Victims",
-                       "Number of Black Male Victims", "Number of Latino Male Victims", "Number of Asian Male Victims",
-                       "Number of Native American Male Victims", "Number of Other Race Male Victims",
-                       "Number of White Female Victims", "Number of Black Female Victims",
-                       "Number of Latino Female Victims", "Number of Asian Female Victims",
-                       "Number of Native American Female Victims", "Number of Other Race Female Victims"]
-
-    df = filter_out_w_past(filter_out_list)
-    if state_name != None:
-        df = df[df['State'] == state_name]
-    df = user_filters(df, filter_gender, filter_race, filter_methods)
-    df = df[["Execution Year"]].value_counts().rename_axis(["Execution Year"]).reset_index(name='Executions')
-    # Add years without executions as 0.
-    df_zeroYears = pd.DataFrame({'Execution Year': range(1977, set_year),
-                                 'Executions': 0})
-    df = (
-        df.merge(df_zeroYears,
-                 on=['Execution Year'],
-                 how='right',
-                 indicator=False)
-    )
-    # Merge is a mess, rebuild Dataframe to specifications.
-    df = df.drop("Executions_y", axis=1)
-    df = df.rename(columns={"Executions_x": "Executions"})
-    df["Executions"] = df["Executions"].fillna(0.0)
-    df["Executions"] = df["Executions"].astype(int)
-    df = df.sort_values("Execution Year")
-
-    fig = px.line(
-        data_frame=df,
-        x="Execution Year",
-        y="Executions",
-        markers=True,
-    )
-    fig.update_layout(graph_style01)
-    fig.update_xaxes(xaxis_style01)
-    fig.update_yaxes(yaxis_style01)
-    fig.update_layout(height=250, margin=dict(l=40, r=10, t=0, b=0))
-    fig.update_xaxes(title="")
+    return figure_json(fig)
+
+@timed
+@cache.memoize()
+@stored()
+def state_plot03(query):
+    # Count executions per year up to the selected year (years without executions stay as 0)
+    index = cube_filter(query, with_past=True)
+    with phase("aggregate"):
+        df = pd.DataFrame({"Execution Year": cube.years[index[YEAR]],
+                           "Executions": cube.totals(index, by=[YEAR])})
+
+    with phase("figure"):
+        fig = px.line(
+            data_frame=df,
+            x="Execution Year",
+            y="Executions",
+            markers=True,
+        )
+        fig.update_layout(graph_style01)
+        fig.update_xaxes(xaxis_style01)
+        fig.update_yaxes(yaxis_style01)
+        fig.update_layout(height=250, margin=dict(l=40, r=10, t=0, b=0))
+        fig.update_xaxes(title="")
 
     if df.empty:
         return null_graph
-    return fig
+    return figure_json(fig)
+
+
+@timed
+@cache.memoize()
+@stored()
+def state_plot04(query):
+    # Victims by race of the executed and race of the victims, from the victim cube (same cells as the count cube)
+    index = cube_filter(query)
+    with phase("aggregate"):
+        # victims[race of the executed, victim sex, victim race]
+        victims = victim_cube.totals(index, by=[RACE]).reshape(len(index[RACE]), len(VICTIM_SEXES), len(VICTIM_RACES))
+        races = cube.labels["Race"][index[RACE]].str.title()
 
+    if victims.sum() == 0:
+        return null_graph
+
+    with phase("figure"):
+        fig = px.imshow(
+            victims.sum(axis=1),
+            x=list(VICTIM_RACES),
+            y=list(races),
+            labels=dict(x="Race of the Victims", y="Race of the Executed", color="Victims"),
+            color_continuous_scale=px.colors.sequential.Redor,
+            text_auto=True,
+            aspect="auto",
+        )
+        # Victims by sex on hover
+        fig.update_traces(customdata=np.moveaxis(victims, 1, -1),
+                          hovertemplate="%{y} executed, %{x} victims: %{z}<br>"
+                                        "Male: %{customdata[0]}, Female: %{customdata[1]}<extra></extra>")
+        fig.update(layout_coloraxis_showscale=False)
+        fig.update_layout(graph_style01)
+        fig.update_xaxes(xaxis_style01, showgrid=False)
+        fig.update_yaxes(yaxis_style01, showgrid=False, tickangle=0)
+        fig.update_layout(height=273, margin=dict(l=40, r=10, t=0, b=0))
 
+    return figure_json(fig)
@@ -0,0 +1,57 @@
+## Filter Query
+# Immutable description of the user's selection (years, filters and state).
+# It is built once per callback from the component values and passed explicitly to every plot
+# function, so concurrent requests never share any state.
+
+from dataclasses import dataclass, replace, asdict
+from typing import Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Query:
+    # Last year of the selected period
+    year: int
+    # Period starts at the first year of the data (Accumulate Years)
+    accumulate: bool
+    gender: Tuple[str, ...]
+    race: Tuple[str, ...]
+    methods: Tuple[str, ...]
+    state: Optional[str] = None
+    # Set in year range mode, the period is then first_year..year
+    first_year: Optional[int] = None
+
+    @classmethod
+    def from_inputs(cls, filter_slct_year, filter_slct_year_acc, filter_gender, filter_race, filter_methods,
+                    state_name=None, filter_slct_year_range=None, filter_slct_range=None):
+        year = int(filter_slct_year)
+        accumulate = 1 in (filter_slct_year_acc or [])
+        first_year = None
+        # Year range mode overrides the single year slider and the accumulate toggle
+        if filter_slct_year_range and filter_slct_range:
+            first_year, year = (int(y) for y in sorted(filter_slct_range))
+            accumulate = False
+
+        # Checklist values are sorted so that the same selection always gives the same (hashable) query
+        return cls(
+            year=year,
+            accumulate=accumulate,
+            gender=tuple(sorted(filter_gender or [])),
+            race=tuple(sorted(filter_race or [])),
+            methods=tuple(sorted(filter_methods or [])),
+            state=state_name,
+            first_year=first_year,
+        )
+
+    def with_state(self, state_name):
+        return replace(self, state=state_name)
+
+    def to_dict(self):
+        # JSON form, e.g. for a dcc.Store (see main.py)
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        for key in ("gender", "race", "methods"):
+            data[key] = tuple(data[key])
+        return cls(**data)
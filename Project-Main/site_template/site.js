@@ -0,0 +1,169 @@
+// Static version of the dashboard (see static_site.py).
+// Every view (year x accumulate x state) is a pre-rendered file under data/, fetched when the view is
+// chosen and kept for later. The figures are drawn with plotly.js, the titles by the same code as in the
+// Dash app (titles.js).
+
+(function () {
+    const titles = window.dash_clientside.titles;
+    const files = {};
+    let manifest = null;
+    let view = {year: null, accumulate: true, state: null};
+    let list = {rows: [], page: 0};
+
+    // JSON of a file under data/, fetched once
+    const fetch_json = function (path) {
+        if (!(path in files)) {
+            files[path] = fetch("data/" + path).then(function (response) {
+                if (!response.ok) {
+                    throw new Error(path + ": " + response.status);
+                }
+                return response.json();
+            });
+        }
+        return files[path];
+    };
+
+    // The figure with its layout template (shared by all figures, see compact_figure in static_site.py)
+    const with_template = function (figure) {
+        if (!figure) {
+            return Promise.resolve(manifest.null_graph);
+        }
+        const template = figure.layout && figure.layout.template;
+        if (typeof template !== "string") {
+            return Promise.resolve(figure);
+        }
+        return fetch_json("templates/" + template + ".json").then(function (resolved) {
+            return Object.assign({}, figure, {layout: Object.assign({}, figure.layout, {template: resolved})});
+        });
+    };
+
+    const draw = function (id, figure) {
+        return with_template(figure).then(function (resolved) {
+            return Plotly.react(id, resolved.data || [], resolved.layout || {}, {displayModeBar: false});
+        });
+    };
+
+    const view_path = function (name) {
+        return (view.accumulate ? "acc" : "year") + "/" + view.year + "/" + name + ".json";
+    };
+
+    const state_view_path = function () {
+        return view_path(view.state === null ? "usa" : manifest.states[view.state]);
+    };
+
+    // Inputs of titles.js: the map's clickData and the year slider values
+    const click_data = function () {
+        return view.state === null ? null : {points: [{location: view.state}]};
+    };
+    const acc_value = function () {
+        return view.accumulate ? [1] : [];
+    };
+
+    const draw_list = function () {
+        const size = manifest.page_size;
+        const page_count = Math.max(1, Math.ceil(list.rows.length / size));
+        list.page = Math.min(list.page, page_count - 1);
+        const body = document.querySelector("#state_data_list02 tbody");
+        body.innerHTML = "";
+        list.rows.slice(list.page * size, (list.page + 1) * size).forEach(function (row) {
+            const tr = document.createElement("tr");
+            row.forEach(function (value) {
+                const td = document.createElement("td");
+                td.textContent = value;
+                tr.appendChild(td);
+            });
+            body.appendChild(tr);
+        });
+        document.getElementById("list_page").textContent = (list.page + 1) + " / " + page_count;
+    };
+
+    // A click on the map chooses the state, the same as clickData in the Dash app
+    let map_listening = false;
+    const on_map_drawn = function (map) {
+        if (!map_listening) {
+            map.on("plotly_click", function (event) {
+                view.state = event.points[0].location;
+                render();
+            });
+            map_listening = true;
+        }
+    };
+
+    const render = function () {
+        document.getElementById("year_value").textContent = view.year;
+        document.getElementById("nationalTitle").textContent = titles.main_title(view.year, acc_value(), [], null);
+        const state_titles = titles.state_titles(click_data(), view.year, acc_value(), [], null);
+        ["stateRacialDataTitle", "stateMethodDataTitle", "stateTimelineTitle", "stateVictimTitle",
+            "stateCountyTitle"].forEach(function (id, i) {
+            document.getElementById(id).textContent = state_titles[i];
+        });
+        document.getElementById("pip_map").hidden = view.state === null;
+
+        // Files arriving after the view changed again are not drawn
+        const overview_path = view_path("overview");
+        fetch_json(overview_path).then(function (overview) {
+            if (overview_path !== view_path("overview")) {
+                return;
+            }
+            draw("execution_map", overview.execution_map).then(on_map_drawn);
+            draw("overview_sidebar_plot_01", overview.overview_sidebar_plot_01);
+        });
+        const state_path = state_view_path();
+        fetch_json(state_path).then(function (state) {
+            if (state_path !== state_view_path()) {
+                return;
+            }
+            const figures = state.figures;
+            draw("state_data_plot_01", figures.state_plot01);
+            draw("state_data_plot_03", figures.state_plot03);
+            draw("state_data_plot_04", figures.state_plot04);
+            if (view.state === null) {
+                draw("state_data_plot_02", manifest.choose_state_graph);
+                draw("state_data_counties", manifest.choose_state_graph);
+            } else {
+                draw("state_data_plot_02", figures.state_plot02);
+                draw("state_data_counties", figures.state_counties);
+                draw("state_map", figures.state_zoom);
+            }
+            document.getElementById("stateListDataTitle").textContent = titles.list_title(state);
+            list = {rows: state.list, page: 0};
+            draw_list();
+        });
+    };
+
+    fetch_json("manifest.json").then(function (loaded) {
+        manifest = loaded;
+        view.year = manifest.default_year;
+
+        const slider = document.getElementById("filter_slct_year");
+        slider.min = manifest.years[0];
+        slider.max = manifest.years[1];
+        slider.value = view.year;
+        document.getElementById("year_min").textContent = manifest.years[0];
+        document.getElementById("year_max").textContent = manifest.years[1];
+        slider.addEventListener("input", function () {
+            view.year = Number(slider.value);
+            render();
+        });
+        const accumulate = document.getElementById("filter_slct_year_acc");
+        accumulate.addEventListener("change", function () {
+            view.accumulate = accumulate.checked;
+            render();
+        });
+
+        const head = document.querySelector("#state_data_list02 thead");
+        head.innerHTML = "<tr>" + manifest.list_columns.map(function (column) {
+            return "<th>" + column + "</th>";
+        }).join("") + "</tr>";
+        document.getElementById("list_previous").addEventListener("click", function () {
+            list.page = Math.max(0, list.page - 1);
+            draw_list();
+        });
+        document.getElementById("list_next").addEventListener("click", function () {
+            list.page += 1;
+            draw_list();
+        });
+
+        render();
+    });
+})();
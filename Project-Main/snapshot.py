@@ -0,0 +1,198 @@
+## Data Snapshot
+# Typed, columnar copy of the execution CSV for fast start-up.
+# The first start parses the CSV (cfg.read_csv) and writes every column of the result to .snapshot/<csv name>/ as a
+# .npy file: numbers as they are, everything else as integer codes plus a category dictionary in meta.json.
+# Later starts memory-map those files instead of parsing the CSV again.
+# The snapshot is rebuilt automatically when the CSV's SHA-256 changes, or explicitly with:
+#   python snapshot.py
+#
+# Arrays derived from the data (the count cube, see cfg.py) are stored next to it with load_array.
+# Memory-mapped files are shared by all processes through the page cache, so worker processes attach to the
+# columns and aggregates without a private copy. Build the snapshot once before starting the workers:
+#   python snapshot.py && gunicorn --workers 8 main:server
+
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, builds are not serialized between processes
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")
+# Bump when the snapshot layout or cfg.read_csv changes, older snapshots are then rebuilt
+SNAPSHOT_VERSION = 2
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def snapshot_dir(csv_path):
+    # Every CSV has its own snapshot, switching datasets (see synth.py) does not rebuild the others
+    return os.path.join(SNAPSHOT_DIR, os.path.splitext(os.path.basename(csv_path))[0])
+
+
+def read_meta(csv_path):
+    try:
+        with open(os.path.join(snapshot_dir(csv_path), "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_current(meta, csv_path):
+    if meta is None or meta.get("version") != SNAPSHOT_VERSION:
+        return False
+    stat = os.stat(csv_path)
+    # Unchanged size and mtime: skip hashing the CSV
+    if [stat.st_size, stat.st_mtime_ns] == meta.get("csv_stat"):
+        return True
+    return file_sha256(csv_path) == meta.get("csv_sha256")
+
+
+def csv_version(csv_path):
+    # Short hash of the CSV, taken from the snapshot when it is current
+    meta = read_meta(csv_path)
+    return (meta["csv_sha256"] if is_current(meta, csv_path) else file_sha256(csv_path))[:12]
+
+
+def save_array(path, array):
+    # Written to a new file and moved into place: processes that mapped the old file keep reading it
+    tmp_path = f"{path}.{os.getpid()}.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def build_lock(csv_path):
+    # One process builds the snapshot, processes starting at the same time wait for it
+    directory = snapshot_dir(csv_path)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def write(df, csv_path):
+    directory = snapshot_dir(csv_path)
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for n, (name, col) in enumerate(df.items()):
+        entry = {"name": name, "file": f"{n}.npy", "dtype": str(col.dtype)}
+        if pd.api.types.is_numeric_dtype(col.dtype) and not col.hasnans:
+            values = col.to_numpy()
+        else:
+            # Dictionary encode (categories and strings), -1 is a missing value
+            categorical = col if isinstance(col.dtype, pd.CategoricalDtype) else col.astype("category")
+            entry["categories"] = categorical.cat.categories.tolist()
+            values = categorical.cat.codes.to_numpy()
+        save_array(os.path.join(directory, entry["file"]), values)
+        columns.append(entry)
+
+    # Arrays derived from the previous data (see load_array) are rebuilt
+    for name in os.listdir(directory):
+        if name.endswith(".npy") and name not in {entry["file"] for entry in columns}:
+            os.remove(os.path.join(directory, name))
+
+    stat = os.stat(csv_path)
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "csv_sha256": file_sha256(csv_path),
+        "csv_stat": [stat.st_size, stat.st_mtime_ns],
+        "rows": len(df),
+        "columns": columns,
+    }
+    # meta.json is written last, a half-written snapshot is never taken as current
+    tmp_path = os.path.join(directory, f"meta.json.{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, "meta.json"))
+
+
+def read(meta, csv_path, columns=None):
+    # Frame of the columns (all by default) of the snapshot, columns that are not asked for are not mapped at all
+    entries = {entry["name"]: entry for entry in meta["columns"]}
+    data = {}
+    for entry in (entries[name] for name in (columns or entries)):
+        values = np.load(os.path.join(snapshot_dir(csv_path), entry["file"]), mmap_mode="r")
+        if "categories" not in entry:
+            data[entry["name"]] = values
+            continue
+        categorical = pd.Categorical.from_codes(values, categories=entry["categories"])
+        if entry["dtype"] == "category":
+            data[entry["name"]] = categorical
+        else:
+            # Plain string column, decoded back to its original dtype
+            data[entry["name"]] = pd.Series(categorical).astype(entry["dtype"])
+    # Keep the memory-mapped arrays instead of copying them into the frame
+    return pd.DataFrame(data, copy=False)
+
+
+def load(csv_path, read_csv, columns=None):
+    # Data of csv_path as returned by read_csv(csv_path) (only the given columns), from the snapshot when it is current
+    meta = read_meta(csv_path)
+    if is_current(meta, csv_path):
+        return read(meta, csv_path, columns)
+    try:
+        with build_lock(csv_path):
+            # Another process may have built it while we waited
+            meta = read_meta(csv_path)
+            if not is_current(meta, csv_path):
+                write(read_csv(csv_path), csv_path)
+        # Read back, so the columns are memory-mapped in the building process too
+        return read(read_meta(csv_path), csv_path, columns)
+    except OSError as e:
+        # A read-only checkout still works, it just parses the CSV on every start
+        print(f"Could not write data snapshot: {e}")
+        df = read_csv(csv_path)
+        return df if columns is None else df[columns]
+
+
+def load_array(csv_path, name, build, version):
+    # Array derived from the data (build() computes it), stored with the snapshot of csv_path and memory-mapped.
+    # The file name carries the snapshot version, the version of the build step (bumped when it changes, e.g.
+    # aggregates.CUBE_VERSION) and the CSV hash: arrays of an older CSV or build are never used.
+    meta = read_meta(csv_path)
+    if meta is None:
+        return build()
+    directory = snapshot_dir(csv_path)
+    suffix = f"-{meta['csv_sha256'][:12]}.npy"
+    file_name = f"{name}-{SNAPSHOT_VERSION}.{version}{suffix}"
+    path = os.path.join(directory, file_name)
+    try:
+        return np.load(path, mmap_mode="r")
+    except OSError:
+        pass
+    array = build()
+    try:
+        save_array(path, array)
+    except OSError as e:
+        print(f"Could not write {name} to the data snapshot: {e}")
+        return array
+    # Older builds of the array are not read any more (processes that mapped them keep their mapping). Arrays of
+    # older CSVs are removed with the snapshot (see write), files still being written end with their pid.
+    for old_name in os.listdir(directory):
+        if old_name.startswith(f"{name}-") and old_name.endswith(suffix) and old_name != file_name:
+            try:
+                os.remove(os.path.join(directory, old_name))
+            except OSError:
+                pass
+    return np.load(path, mmap_mode="r")
+
+
+if __name__ == '__main__':
+    # Importing cfg loads the data and the cube through load() and load_array(), which (re)build them when needed
+    import cfg
+
+    print(f"{snapshot_dir(cfg.DATA_CSV)}: {len(cfg.Data)} rows, CSV sha256 {read_meta(cfg.DATA_CSV)['csv_sha256'][:12]}")
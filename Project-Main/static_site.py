@@ -0,0 +1,218 @@
+## Static Site
+# The dashboard for the default filters as a static site, for serving from a CDN without any Python server:
+#   python static_site.py build [--out site] [--jobs 8]
+# Every year x both accumulate modes x (the USA and every state) is built with the plot functions, the same figures
+# the Dash app shows (figures already in the figure store are read from there, see figstore.py). The page
+# (site_template/) only has the year slider, the accumulate toggle and the map to choose a state, it fetches the
+# files of a view when it is chosen:
+#   data/manifest.json                       years, states and list columns
+#   data/<acc|year>/<year>/overview.json     map and line chart of the overview
+#   data/<acc|year>/<year>/<state>.json      figures, number of executions and list of the state section
+#                                            ("usa.json" for the whole country)
+#   data/templates/<hash>.json               plotly layout templates, shared by all figures
+# Map outlines are copied from geodata/, map figures point to them by relative URL.
+# The filters, the year range mode and the animation need the server and are not part of the static site.
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+from multiprocessing import Pool
+
+from plotly.io.json import to_json_plotly
+from plotly.offline import get_plotlyjs
+
+import cfg
+from figstore import DEFAULT_CHECKLISTS
+from geo import GEO_DIR
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(PROJECT_DIR, "site_template")
+ASSETS_DIR = os.path.join(PROJECT_DIR, "assets")
+DEFAULT_YEAR = 2005
+
+# Figures of the state section, the ones that need a chosen state are left out of usa.json
+STATE_FIGURES = ["state_plot01", "state_plot02", "state_plot03", "state_plot04", "state_counties", "state_zoom"]
+NATIONAL_FIGURES = ["state_plot01", "state_plot03", "state_plot04"]
+
+
+def mode_name(accumulate):
+    return "acc" if accumulate else "year"
+
+
+def state_slug(state):
+    return "usa" if state is None else state.lower().replace(" ", "-")
+
+
+def view_path(out, accumulate, year, name):
+    return os.path.join(out, "data", mode_name(accumulate), str(year), f"{name}.json")
+
+
+def write_json(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(to_json_plotly(value))
+
+
+## Views
+
+def compact_figure(out, fig):
+    # The figure with its layout template replaced by the hash of data/templates/<hash>.json and the map outlines
+    # by a URL relative to the page. The figure itself may be cached (see cache.py), it is copied and not changed.
+    fig = dict(fig, layout=dict(fig.get("layout", {})))
+    template = fig["layout"].pop("template", None)
+    if template is not None:
+        template_json = to_json_plotly(template)
+        digest = hashlib.sha1(template_json.encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(out, "data", "templates", f"{digest}.json")
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(template_json)
+            os.replace(tmp_path, path)
+        fig["layout"]["template"] = digest
+    data = fig.get("data") or []
+    if data and isinstance(data[0].get("geojson"), str):
+        fig["data"] = [dict(data[0], geojson=data[0]["geojson"].lstrip("/"))] + list(data[1:])
+    return fig
+
+
+def figure(out, name, query):
+    import plot_functions as pf
+    try:
+        return compact_figure(out, getattr(pf, name)(query))
+    except Exception as e:
+        # The page shows the "no data" graph instead
+        print(f"{name}{(query,)}: {e}", file=sys.stderr)
+        return None
+
+
+def build_overview(out, accumulate, year):
+    from query import Query
+    query = Query.from_inputs(year, [1] if accumulate else [], *DEFAULT_CHECKLISTS)
+    write_json(view_path(out, accumulate, year, "overview"), {
+        "execution_map": figure(out, "overview_map", query),
+        "overview_sidebar_plot_01": figure(out, "overview_plot01", query),
+    })
+
+
+def build_state(out, accumulate, year, state):
+    from query import Query
+    import plot_functions as pf
+    query = Query.from_inputs(year, [1] if accumulate else [], *DEFAULT_CHECKLISTS, state)
+    # The timeline ignores the accumulate toggle (see update_state_timeline)
+    timeline_query = Query.from_inputs(year, None, *DEFAULT_CHECKLISTS, state)
+    figures = {}
+    for name in STATE_FIGURES if state is not None else NATIONAL_FIGURES:
+        figures[name] = figure(out, name, timeline_query if name == "state_plot03" else query)
+    # The whole list in one page, the page pages through it
+    records, _ = pf.execute_list(query, 0, len(pf.Data), ())
+    write_json(view_path(out, accumulate, year, state_slug(state)), {
+        "executions": pf.exec_counter(query),
+        "year": query.year,
+        "accumulate": query.accumulate,
+        "first_year": query.first_year,
+        "state": state,
+        "figures": figures,
+        "list": [[record[column] for column in pf.LIST_COLUMNS] for record in records],
+    })
+
+
+def build_one(job):
+    kind, args = job
+    try:
+        if kind == "overview":
+            build_overview(*args)
+        else:
+            build_state(*args)
+        return True
+    except Exception as e:
+        print(f"{kind}{args[1:]}: {e}", file=sys.stderr)
+        return False
+
+
+def years():
+    import plot_functions as pf
+    return range(int(pf.cube.years[0]), int(pf.cube.years[-1]) + 1)
+
+
+def states():
+    import plot_functions as pf
+    return sorted(pf.cube.labels["State"])
+
+
+def jobs_for(out):
+    for accumulate in (True, False):
+        for year in years():
+            yield "overview", (out, accumulate, year)
+            for state in [None] + states():
+                yield "state", (out, accumulate, year, state)
+
+
+## Bundle
+
+def write_manifest(out):
+    import plot_functions as pf
+    write_json(os.path.join(out, "data", "manifest.json"), {
+        "version": cfg.data_version,
+        "years": [years()[0], years()[-1]],
+        "default_year": DEFAULT_YEAR,
+        "states": {state: state_slug(state) for state in states()},
+        "list_columns": pf.LIST_COLUMNS,
+        "page_size": pf.LIST_PAGE_SIZE,
+        "null_graph": cfg.null_graph,
+        "choose_state_graph": cfg.choose_state_graph,
+    })
+
+
+def copy_geometry(out):
+    # Outlines the map figures point to (the query string of their URLs is only for caching)
+    from geo import load_counties
+    urls = {cfg.states_geojson_map_url}
+    for state in states():
+        counties = load_counties(state)
+        if counties is not None:
+            urls.add(counties[0])
+    for url in sorted(urls):
+        path = url.lstrip("/").split("?")[0]
+        target = os.path.join(out, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(os.path.join(GEO_DIR, os.path.relpath(path, "geodata")), target)
+    return len(urls)
+
+
+def copy_page(out):
+    for name in os.listdir(TEMPLATE_DIR):
+        shutil.copyfile(os.path.join(TEMPLATE_DIR, name), os.path.join(out, name))
+    # Titles are built by the same code as in the Dash app
+    for name in ("titles.js", "custom.css", "bootstrap.min.css"):
+        shutil.copyfile(os.path.join(ASSETS_DIR, name), os.path.join(out, name))
+    with open(os.path.join(out, "plotly.min.js"), "w", encoding="utf-8") as f:
+        f.write(get_plotlyjs())
+
+
+def build(out, jobs=1):
+    if os.path.isdir(out):
+        shutil.rmtree(out)
+    os.makedirs(out)
+    calls = list(jobs_for(out))
+    if jobs > 1:
+        with Pool(jobs) as pool:
+            results = pool.map(build_one, calls, chunksize=8)
+    else:
+        results = [build_one(call) for call in calls]
+    write_manifest(out)
+    outlines = copy_geometry(out)
+    copy_page(out)
+    print(f"{sum(results)} / {len(calls)} views and {outlines} outline files written to {out}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Static site")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--out", default=os.path.join(PROJECT_DIR, "site"))
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    build(os.path.abspath(args.out), args.jobs)
@@ -0,0 +1,79 @@
+## Synthetic Data
+# Execution tables of any size (10^5 - 10^7 rows) with the columns of the DPIC CSV, to see how the dashboard scales.
+# Rows are drawn from the real file: year, state, county, race, sex, method, victims etc. of a generated row are
+# those of a random real execution, so the joint distributions (e.g. methods per state and period) stay realistic.
+# Names are drawn independently from the real first/last names and the day within the year is random.
+#
+#   python synth.py 1000000             write synthetic/executions-1000000.csv
+#   python synth.py 1000000 --serve     ... and start the dashboard on it
+# The dashboard reads the file given in EXECUTIONS_CSV (see cfg.py), e.g. for the benchmark:
+#   EXECUTIONS_CSV=synthetic/executions-1000000.csv python benchmark.py
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SYNTHETIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synthetic")
+SOURCE_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DPIC Execution Database - U.S. Executions.csv")
+# Rows generated and written at a time
+CHUNK_ROWS = 1_000_000
+
+# Columns drawn independently of the rest of the row
+NAME_COLUMNS = ["First Name", "Last Name", "Middle Name(s)", "Suffix"]
+
+
+def synthetic_path(rows, seed=0):
+    suffix = f"-seed{seed}" if seed else ""
+    return os.path.join(SYNTHETIC_DIR, f"executions-{rows}{suffix}.csv")
+
+
+def generate_chunk(source, first_number, rows, rng):
+    # rows synthetic executions numbered from first_number, as a frame with the columns of the CSV
+    df = source.iloc[rng.integers(0, len(source), rows)].reset_index(drop=True)
+    for column in NAME_COLUMNS:
+        df[column] = source[column].to_numpy()[rng.integers(0, len(source), rows)]
+    df["Execution#"] = np.arange(first_number, first_number + rows)
+
+    # Random day of the sampled year
+    years = pd.DatetimeIndex(df["Execution Date"]).year.to_numpy()
+    first_days = pd.to_datetime({"year": years, "month": 1, "day": 1})
+    lengths = np.where(pd.DatetimeIndex(first_days).is_leap_year, 366, 365)
+    dates = first_days + pd.to_timedelta(rng.integers(0, lengths), unit="D")
+    df["Execution Date"] = dates.dt.strftime("%m/%d/%Y")
+    return df[source.columns]
+
+
+def generate(rows, path, seed=0, source_csv=SOURCE_CSV):
+    source = pd.read_csv(source_csv, encoding="utf-8", sep=",", dtype=str, keep_default_na=False)
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written to a temporary file first, a cancelled run does not leave a truncated CSV behind
+    tmp_path = f"{path}.{os.getpid()}"
+    for first in range(0, rows, CHUNK_ROWS):
+        chunk = generate_chunk(source, first + 1, min(CHUNK_ROWS, rows - first), rng)
+        chunk.to_csv(tmp_path, mode="w" if first == 0 else "a", header=first == 0, index=False)
+        print(f"{first + len(chunk)} / {rows} rows")
+    os.replace(tmp_path, path)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic execution data")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serve", action="store_true", help="start the dashboard on the generated data")
+    args = parser.parse_args()
+
+    path = synthetic_path(args.rows, args.seed)
+    if not os.path.exists(path):
+        generate(args.rows, path, args.seed)
+    print(path)
+
+    if args.serve:
+        # cfg reads the data when main is imported
+        os.environ["EXECUTIONS_CSV"] = path
+        import main
+
+        main.app.run(debug=False, threaded=True)
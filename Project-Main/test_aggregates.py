@@ -0,0 +1,72 @@
+## Count cube tests
+#   python -m pytest test_aggregates.py
+# The cube views (see aggregates.py) must count the same rows as filtering Data with pandas.
+
+import numpy as np
+import pytest
+
+import plot_functions
+from aggregates import STATE, YEAR
+from figstore import DEFAULT_CHECKLISTS
+from query import Query
+
+QUERIES = [
+    Query.from_inputs(2005, [1], *DEFAULT_CHECKLISTS),
+    Query.from_inputs(1999, [], *DEFAULT_CHECKLISTS),
+    Query.from_inputs(2021, [1], ["Female"], ["Black", "White"], ["Lethal Injection"]),
+    Query.from_inputs(2010, [], ["Male"], ["Latino"], ["Electrocution", "Lethal Injection"]),
+    # Year range mode
+    Query.from_inputs(2005, [1], *DEFAULT_CHECKLISTS, None, [1], [1990, 2000]),
+    Query.from_inputs(2005, [], ["Male"], ["White"], ["Gas", "Hanging"], None, [1], [1977, 1999]),
+    # Nothing selected
+    Query.from_inputs(2005, [1], [], *DEFAULT_CHECKLISTS[1:]),
+    Query.from_inputs(1978, [], *DEFAULT_CHECKLISTS),
+]
+
+
+def recount(query):
+    # Rows of Data the query selects, filtered with pandas
+    df = plot_functions.Data
+    if query.first_year is not None:
+        years = df["Execution Year"].between(query.first_year, query.year)
+    elif query.accumulate:
+        years = df["Execution Year"] <= query.year
+    else:
+        years = df["Execution Year"] == query.year
+    return df[years & df["Sex"].isin(query.gender) & df["Race"].isin(query.race)
+              & df["Execution Method"].isin(query.methods)]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_totals_match_pandas(query):
+    index = plot_functions.cube_filter(query)
+    assert int(plot_functions.cube.totals(index)) == len(recount(query))
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_totals_by_state_match_pandas(query):
+    expected = recount(query)["State"].value_counts()
+    df = plot_functions.cube.frame(plot_functions.cube_filter(query), by=[STATE])
+    assert dict(zip(df["State"], df["Executions"])) == expected[expected > 0].to_dict()
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_counts_by_year_match_pandas(query):
+    expected = recount(query)["Execution Year"].value_counts()
+    df = plot_functions.cube.frame(plot_functions.cube_filter(query), by=[YEAR])
+    assert dict(zip(df["Execution Year"].astype(int), df["Executions"])) == \
+        {int(year): count for year, count in expected.items()}
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_state_window_matches_pandas(query):
+    state = "Texas"
+    cube = plot_functions.cube
+    index = plot_functions.cube_filter(query.with_state(state))
+    # window sums the year axis of the cells
+    window = cube.window(index[YEAR])[np.ix_(*index[1:])]
+    assert int(window.sum()) == (recount(query)["State"] == state).sum()
+
+
+def test_empty_selections_are_empty():
+    assert len(recount(QUERIES[-2])) == len(recount(QUERIES[-1])) == 0
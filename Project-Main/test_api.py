@@ -0,0 +1,49 @@
+## Aggregate API tests
+#   python -m pytest test_api.py
+
+import pytest
+
+import main
+import plot_functions
+from figstore import DEFAULT_CHECKLISTS
+from query import Query
+
+
+@pytest.fixture(scope="module")
+def client():
+    return main.app.server.test_client()
+
+
+def dashboard_total(year=2021, state=None):
+    # Executions the dashboard shows with its default filters, accumulated up to year
+    return plot_functions.exec_counter(Query.from_inputs(year, [1], *DEFAULT_CHECKLISTS, state))
+
+
+@pytest.mark.parametrize("url", ["/api/v1/counts?accumulate=1", "/api/v1/counts?by=&accumulate=1"])
+def test_counts_without_by_is_the_total(client, url):
+    response = client.get(url)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["by"] == []
+    assert body["counts"] == [{"executions": body["total"]}]
+    assert body["total"] == dashboard_total()
+
+
+def test_counts_of_one_state(client):
+    response = client.get("/api/v1/counts?state=Texas&accumulate=1")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["filters"]["state"] == "Texas"
+    assert body["total"] == dashboard_total(state="Texas") > 0
+
+
+def test_counts_of_a_year_without_executions(client):
+    body = client.get("/api/v1/counts?state=Maine&year=1990").get_json()
+    assert body["counts"] == [{"executions": 0}]
+    assert body["total"] == 0
+
+
+def test_default_filters_match_the_dashboard(client):
+    body = client.get("/api/v1/counts?by=method&accumulate=1").get_json()
+    assert {row["method"] for row in body["counts"]} <= set(DEFAULT_CHECKLISTS[2])
+    assert body["total"] == dashboard_total()
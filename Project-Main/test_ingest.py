@@ -0,0 +1,136 @@
+## Ingestion tests
+#   python -m pytest test_ingest.py
+# Rows are added to the data in memory only (ingest.add_rows), the CSV is not changed.
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cfg
+import ingest
+import plot_functions
+from aggregates import count_rows, frame_axes
+from figstore import DEFAULT_CHECKLISTS
+from query import Query
+
+
+@pytest.fixture
+def live_data():
+    # Put the data back after the test
+    saved = cfg.Data, cfg.names, cfg.cube, cfg.victim_cube, cfg.data_version
+    yield
+    cfg.Data, cfg.names, cfg.cube, cfg.victim_cube, cfg.data_version = saved
+    plot_functions.set_data(*saved[:4])
+
+
+@pytest.fixture
+def csv_copy(live_data, tmp_path, monkeypatch):
+    # Rows are appended to a copy of the CSV, read from its end
+    path = tmp_path / "executions.csv"
+    shutil.copyfile(cfg.DATA_CSV, path)
+    monkeypatch.setattr(cfg, "DATA_CSV", str(path))
+    monkeypatch.setattr(ingest, "csv_offset", os.path.getsize(path))
+    return path
+
+
+def csv_lines(n):
+    # The first n data lines of the CSV
+    with open(cfg.DATA_CSV, "rb") as f:
+        return f.readlines()[1:n + 1]
+
+
+def csv_rows(n):
+    # The first n rows of the CSV, as read by pd.read_csv
+    return pd.read_csv(cfg.DATA_CSV, nrows=n)
+
+
+def total(state=None):
+    return plot_functions.exec_counter(Query.from_inputs(2021, [1], *DEFAULT_CHECKLISTS, state))
+
+
+def test_add_rows_counts_new_rows(live_data):
+    before = total()
+    assert ingest.add_rows(csv_rows(3)) == 3
+    assert total() == before + 3
+
+
+@pytest.mark.parametrize("column", ["State", "Sex", "Race", "Execution Method"])
+def test_incomplete_rows_are_rejected(live_data, column):
+    raw = csv_rows(3)
+    raw.loc[1, column] = np.nan
+    rows, version = len(cfg.Data), cfg.data_version
+    with pytest.raises(ValueError):
+        ingest.add_rows(raw, strict=True)
+    assert len(cfg.Data) == rows
+    assert cfg.data_version == version
+
+
+def test_incomplete_rows_are_skipped(live_data):
+    raw = csv_rows(3)
+    raw.loc[1, "State"] = np.nan
+    # Counted under no state, not under the last state label
+    last_state = plot_functions.cube.labels["State"][-1]
+    before, before_last = total(), total(last_state)
+    assert ingest.add_rows(raw) == 2
+    assert len(cfg.Data) == len(cfg.names)
+    assert total() == before + 2
+    assert total(last_state) == before_last + (raw.loc[[0, 2], "State"] == last_state).sum()
+
+
+def test_count_rows_leaves_out_missing_labels():
+    df = cfg.Data.iloc[:10].copy()
+    df["Race"] = df["Race"].cat.set_categories(df["Race"].cat.categories[:-1])
+    years, labels = frame_axes(df)
+    counts = count_rows(df, years, labels)
+    assert counts.sum() == (df["Race"].cat.codes >= 0).sum()
+
+
+@pytest.mark.parametrize("column, value", [("Execution Date", np.nan), ("Number of Victims", np.nan),
+                                           ("Number of Victims", -1), ("Number of White Male Victims", 2.5)])
+def test_invalid_rows_are_rejected(live_data, column, value):
+    raw = csv_rows(3)
+    raw[column] = raw[column].astype(object)
+    raw.loc[1, column] = value
+    rows = len(cfg.Data)
+    with pytest.raises(ValueError):
+        ingest.add_rows(raw, strict=True)
+    assert len(cfg.Data) == rows
+    assert ingest.add_rows(raw) == 2
+    assert len(cfg.Data) == rows + 2
+
+
+def test_large_victim_counts_widen_the_column(live_data):
+    raw = csv_rows(1)
+    raw.loc[0, "Number of Victims"] = 300
+    assert ingest.add_rows(raw) == 1
+    assert cfg.Data["Number of Victims"].iloc[-1] == 300
+
+
+def test_broken_lines_are_skipped(csv_copy):
+    good = csv_lines(2)
+    blank_date = b",".join(field if n != 1 else b"" for n, field in enumerate(good[0].split(b",")))
+    fields = csv_lines(1)[0].rstrip(b"\n") + b",extra\n"
+    with open(csv_copy, "ab") as f:
+        f.writelines([good[0], blank_date, fields, good[1]])
+    rows = len(cfg.Data)
+    with ingest.lock:
+        assert ingest.read_appended() == 2
+        assert ingest.csv_offset == os.path.getsize(csv_copy)
+        assert ingest.read_appended() == 0
+    assert len(cfg.Data) == rows + 2
+    # Records posted after the broken lines are still added
+    assert ingest.add_records(csv_rows(1).to_dict("records")) == 1
+    assert len(cfg.Data) == rows + 3
+
+
+def test_rows_without_county_are_listed(live_data):
+    raw = csv_rows(1)
+    raw["County"] = raw["County"].astype(object)
+    raw.loc[0, "County"] = np.nan
+    assert ingest.add_rows(raw, strict=True) == 1
+    state = raw.loc[0, "State"]
+    query = Query.from_inputs(2021, [1], *DEFAULT_CHECKLISTS, state)
+    assert len(plot_functions.execute_list_rows(query)) == total(state)